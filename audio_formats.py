@@ -0,0 +1,129 @@
+"""
+Formatos de salida para el audio TTS.
+
+Piper entrega WAV PCM 16-bit; aquí se recodifica en proceso a Opus dentro de
+OGG con libsndfile (``soundfile``, ``format='OGG', subtype='OPUS'``), sin
+lanzar ffmpeg ni escribir archivos. Opus solo admite 8/12/16/24/48 kHz, así que
+el audio se remuestrea a la frecuencia del preset antes de codificar.
+
+libsndfile no expone la "application" de Opus (voip/audio) ni el modo de
+bitrate en OGG: cada preset fija la frecuencia de muestreo y un bitrate
+objetivo, que se traduce al ``compression_level`` de libsndfile (interpolación
+lineal entre ~256 kbps con nivel 0 y ~6 kbps con nivel 1).
+
+``negotiate`` elige el formato según la cabecera Accept (con valores q).
+"""
+import io
+import logging
+from collections import namedtuple
+from typing import Dict, Optional
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+OutputFormat = namedtuple("OutputFormat", ["name", "media_type", "extension"])
+OpusPreset = namedtuple("OpusPreset", ["sample_rate", "bitrate"])
+
+WAV = OutputFormat("wav", "audio/wav", "wav")
+OPUS = OutputFormat("opus", "audio/ogg; codecs=opus", "opus")
+FORMATS: Dict[str, OutputFormat] = {fmt.name: fmt for fmt in (WAV, OPUS)}
+
+# Tipos MIME aceptados por cada formato (sin parámetros)
+MEDIA_TYPES = {
+    "audio/wav": WAV, "audio/wave": WAV, "audio/x-wav": WAV, "audio/vnd.wave": WAV,
+    "audio/ogg": OPUS, "audio/opus": OPUS, "application/ogg": OPUS,
+}
+
+OPUS_PRESETS: Dict[str, OpusPreset] = {
+    "voip": OpusPreset(16000, 16000),     # banda ancha, mínimo tamaño para voz
+    "mobile": OpusPreset(24000, 24000),   # super banda ancha, equilibrio para redes móviles
+    "high": OpusPreset(48000, 48000),     # banda completa
+}
+
+# Extremos de bitrate del codificador Opus de libsndfile (compression_level 0 y 1)
+_OPUS_MAX_BITRATE = 256000
+_OPUS_MIN_BITRATE = 6000
+
+try:
+    OPUS_AVAILABLE = "OPUS" in sf.available_subtypes("OGG")
+except Exception:
+    OPUS_AVAILABLE = False
+if not OPUS_AVAILABLE:
+    logger.warning("libsndfile sin soporte Opus (requiere >= 1.0.29): el TTS se servirá en WAV")
+
+
+def opus_compression_level(bitrate: int) -> float:
+    """compression_level de libsndfile para un bitrate objetivo en bps"""
+    level = (_OPUS_MAX_BITRATE - bitrate) / (_OPUS_MAX_BITRATE - _OPUS_MIN_BITRATE)
+    return min(1.0, max(0.0, level))
+
+
+def encode_opus(wav_bytes: bytes, preset: str = "mobile") -> bytes:
+    """WAV en memoria -> Opus en OGG en memoria, remuestreado a la frecuencia del preset"""
+    settings = OPUS_PRESETS[preset]
+    audio, source_rate = sf.read(io.BytesIO(wav_bytes), dtype="float32")
+    if source_rate != settings.sample_rate:
+        import librosa
+        audio = librosa.resample(audio, orig_sr=source_rate, target_sr=settings.sample_rate, axis=0)
+    buffer = io.BytesIO()
+    sf.write(buffer, np.ascontiguousarray(audio), settings.sample_rate, format="OGG", subtype="OPUS",
+             compression_level=opus_compression_level(settings.bitrate))
+    return buffer.getvalue()
+
+
+def encode(wav_bytes: bytes, fmt: OutputFormat, preset: str = "mobile") -> bytes:
+    if fmt is OPUS:
+        return encode_opus(wav_bytes, preset)
+    return wav_bytes
+
+
+def negotiate(accept: Optional[str], default: OutputFormat = WAV) -> OutputFormat:
+    """Formato preferido según Accept (valores q; con igual q gana el primero listado).
+    Un tipo explícito prevalece sobre */* y audio/*, así que q=0 excluye ese formato
+    aunque haya comodín. Sin cabecera o sin coincidencias: default si no está excluido, si no
+    otro formato no excluido; si el cliente los excluye todos se responde igual con default."""
+    if default is OPUS and not OPUS_AVAILABLE:
+        default = WAV
+    if not accept:
+        return default
+
+    explicit = {}    # formato -> (q, posición) de su tipo explícito con mayor q
+    wildcard = None  # (q, posición) del comodín con mayor q
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        media_type = media_type.lower()
+        q = 1.0
+        for param in params:
+            if param.lower().startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ("*/*", "audio/*"):
+            if wildcard is None or q > wildcard[0]:
+                wildcard = (q, position)
+            continue
+        fmt = MEDIA_TYPES.get(media_type)
+        if fmt is not None and (fmt not in explicit or q > explicit[fmt][0]):
+            explicit[fmt] = (q, position)
+
+    # default primero: ante un empate por comodín se queda el formato por defecto
+    formats = [default] + [fmt for fmt in FORMATS.values() if fmt is not default]
+    formats = [fmt for fmt in formats if fmt is not OPUS or OPUS_AVAILABLE]
+    best, best_rank = None, None
+    for fmt in formats:
+        q, position = explicit.get(fmt, wildcard or (0.0, 0))
+        if q <= 0:
+            continue
+        rank = (q, -position)
+        if best_rank is None or rank > best_rank:
+            best, best_rank = fmt, rank
+    if best is not None:
+        return best
+    # Nada aceptable (p. ej. solo text/html): el primero que el cliente no haya excluido
+    for fmt in formats:
+        if explicit.get(fmt, (1.0, 0))[0] > 0:
+            return fmt
+    return default
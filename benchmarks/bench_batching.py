@@ -0,0 +1,110 @@
+"""
+Benchmark: decodificación por lotes (stt_batching.WhisperBatchScheduler) vs. una llamada por enunciado.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_batching                  # 8 enunciados sintéticos, uno de más de 30 s
+    python -m benchmarks.bench_batching a.wav b.wav ...  # WAV PCM 16-bit mono a 16 kHz
+
+El modelo es STT_MODEL_SIZE / STT_COMPUTE_TYPE (por defecto "tiny" / "int8"); acepta
+también la ruta de un modelo CTranslate2 local.
+
+Además del tiempo verifica que el pipeline corra de verdad sobre los enunciados
+concatenados: que todas las peticiones formen un único lote y que cada una
+reciba segmentos dentro de su propio tramo del audio concatenado.
+"""
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+from stt_batching import WhisperBatchScheduler
+
+SAMPLE_RATE = 16000
+MODEL_SIZE = os.getenv("STT_MODEL_SIZE", "tiny")
+COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")
+DECODE_OPTIONS = dict(language="es", beam_size=1, without_timestamps=True)
+
+
+def synthetic_utterances(count: int = 8):
+    """Tramos tipo voz (armónicos modulados) de 1-4 s; el último dura 35 s para forzar varios clips"""
+    rng = np.random.default_rng(0)
+    utterances = []
+    for index in range(count):
+        seconds = 35.0 if index == count - 1 else rng.uniform(1.0, 4.0)
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+        utterances.append((0.2 * voiced * envelope + rng.normal(0, 0.005, t.size)).astype(np.float32))
+    return utterances
+
+
+def load_wav(path: str) -> np.ndarray:
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1 or wf.getframerate() != SAMPLE_RATE:
+            raise SystemExit("Se requiere WAV PCM 16-bit mono a 16 kHz")
+        frames = wf.readframes(wf.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def main():
+    if len(sys.argv) > 2:
+        utterances = [load_wav(path) for path in sys.argv[1:]]
+    elif len(sys.argv) == 2:
+        raise SystemExit("Se necesitan al menos dos WAV para formar un lote")
+    else:
+        utterances = synthetic_utterances()
+
+    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type=COMPUTE_TYPE)
+    scheduler = WhisperBatchScheduler(model, max_batch_size=len(utterances), max_wait_ms=200)
+
+    started = time.perf_counter()
+    for pcm in utterances:
+        segments, _ = model.transcribe(pcm, **DECODE_OPTIONS)
+        list(segments)
+    sequential_time = time.perf_counter() - started
+
+    # Todas las peticiones llegan a la vez, como desde hilos de request concurrentes
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(utterances)) as executor:
+        futures = [executor.submit(scheduler.transcribe, pcm, DECODE_OPTIONS) for pcm in utterances]
+        results = [future.result() for future in futures]
+    batched_time = time.perf_counter() - started
+    stats = scheduler.stats()
+    scheduler.close()
+
+    # Tramo de cada enunciado dentro del audio concatenado del lote
+    errors = []
+    span_start = 0.0
+    for index, (pcm, (segments, _)) in enumerate(zip(utterances, results)):
+        span_end = span_start + len(pcm) / SAMPLE_RATE
+        if not segments:
+            errors.append(f"enunciado {index}: sin segmentos")
+        for segment in segments:
+            midpoint = (segment.start + segment.end) / 2
+            if not span_start <= midpoint <= span_end:
+                errors.append(f"enunciado {index}: segmento {segment.start:.2f}-{segment.end:.2f}s "
+                              f"fuera de su tramo {span_start:.2f}-{span_end:.2f}s")
+        span_start = span_end
+    if stats["batches"] != 1:
+        errors.append(f"se esperaba un único lote: {stats['batch_size_histogram']}")
+
+    total = sum(len(pcm) for pcm in utterances) / SAMPLE_RATE
+    print(f"Modelo: {MODEL_SIZE} ({COMPUTE_TYPE}), {len(utterances)} enunciados, {total:.0f}s de audio")
+    print(f"Una llamada por enunciado: {sequential_time * 1000:8.1f} ms")
+    print(f"Por lotes:                 {batched_time * 1000:8.1f} ms "
+          f"(lotes: {stats['batch_size_histogram']})")
+    print(f"Aceleración:               {sequential_time / batched_time:8.2f}x")
+    print(f"Segmentos en su tramo:     {not errors}")
+    for error in errors:
+        print(f"  {error}")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
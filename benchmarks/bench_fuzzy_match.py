@@ -0,0 +1,78 @@
+"""
+Benchmark: FuzzyIndex (stt_service.FUZZY_INDEX) vs. difflib.get_close_matches
+sobre todo el vocabulario, como hacía word_correction.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_fuzzy_match
+
+Las palabras se generan mutando el vocabulario (sustituciones, inserciones y
+borrados). Se verifica que la búsqueda por índice (sin clave fonética) elija
+exactamente lo mismo que difflib y se cuentan los casos que la clave fonética
+resuelve de otra forma.
+"""
+import difflib
+import random
+import time
+
+from fuzzy_match import FuzzyIndex
+from stt_service import LETTERS, NUM_WORDS
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyzñáéíóú"
+
+
+def mutate(word: str, rng: random.Random) -> str:
+    chars = list(word)
+    for _ in range(rng.randint(1, 2)):
+        op = rng.random()
+        position = rng.randrange(len(chars) + 1)
+        if op < 0.4 and position < len(chars):
+            chars[position] = rng.choice(ALPHABET)
+        elif op < 0.7:
+            chars.insert(position, rng.choice(ALPHABET))
+        elif len(chars) > 1 and position < len(chars):
+            del chars[position]
+    return "".join(chars)
+
+
+def legacy_correction(word: str):
+    all_words = list(LETTERS.keys()) + list(NUM_WORDS.keys())
+    matches = difflib.get_close_matches(word, all_words, n=1, cutoff=0.7)
+    if matches:
+        return LETTERS.get(matches[0], NUM_WORDS.get(matches[0]))
+    return None
+
+
+def main():
+    rng = random.Random(0)
+    vocabulary = list(LETTERS) + list(NUM_WORDS)
+    words = [mutate(rng.choice(vocabulary), rng) for _ in range(3000)]
+    index = FuzzyIndex({**NUM_WORDS, **LETTERS}, cutoff=0.7)
+
+    started = time.perf_counter()
+    legacy = [legacy_correction(word) for word in words]
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed = [index.best_match(word) for word in words]
+    indexed_time = time.perf_counter() - started
+    indexed = [index.vocabulary[m[0]] if m else None for m in indexed]
+
+    started = time.perf_counter()
+    full = [index.lookup(word) for word in words]
+    cached_time = time.perf_counter() - started
+
+    mismatches = sum(a != b for a, b in zip(legacy, indexed))
+    phonetic = sum(a != b for a, b in zip(legacy, full))
+    print(f"Palabras: {len(words)} (vocabulario {len(vocabulary)})")
+    print(f"difflib lineal:        {legacy_time / len(words) * 1e6:8.1f} µs/palabra")
+    print(f"Índice invertido:      {indexed_time / len(words) * 1e6:8.1f} µs/palabra "
+          f"({legacy_time / indexed_time:.1f}x)")
+    print(f"lookup (+fonética, LRU): {cached_time / len(words) * 1e6:6.1f} µs/palabra")
+    print(f"Diferencias índice vs difflib: {mismatches}")
+    print(f"Resueltas distinto por la clave fonética: {phonetic}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
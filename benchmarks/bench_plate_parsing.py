@@ -0,0 +1,144 @@
+"""
+Benchmark: tokenizador con trie precompilado (stt_service.tokenize_plate_chars)
+vs. el bucle original de extract_chars (ventanas de 3/2/1 palabras por posición).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_plate_parsing                   # corpus escrito a mano (abajo)
+    python -m benchmarks.bench_plate_parsing transcripciones.txt  # una transcripción real por línea
+
+El corpus incluido son 20 frases escritas a mano imitando salidas de Whisper, no
+transcripciones grabadas. Con él ambas versiones tardan lo mismo dentro del ruido
+(entre ~0.7x y 1.0x según la corrida; el trie además registra la procedencia de
+cada carácter): el cambio a trie preserva el comportamiento salvo las frases de
+4 palabras de abajo y no da una mejora de velocidad medible. Para medir con
+datos reales, pasar un archivo con transcripciones registradas.
+
+Importa stt_service, por lo que necesita faster_whisper instalado. Además del
+tiempo muestra las transcripciones donde ambos difieren: las únicas esperadas
+son frases de 4 palabras ("la doble u ve", "la i de griega") que el bucle
+original nunca reconocía.
+"""
+import contextlib
+import io
+import sys
+import time
+
+import stt_service
+from stt_service import LETTERS, NUM_WORDS, clean_text, word_correction
+
+SKIP_WORDS = ['transcribir', 'exactamente', 'cada', 'carácter', 'dictado',
+              'sin', 'interpretarlo', 'como', 'palabras', 'usuario',
+              'vehicular', 'peruana', 'letras', 'números']
+
+# Salidas de Whisper para placas dictadas, escritas a mano (no son transcripciones grabadas)
+CORPUS = [
+    "A B C 1 2 3",
+    "a be ce uno dos tres",
+    "equis ye zeta cuatro cinco seis",
+    "Ve doble ve ka siete ocho nueve",
+    "ele eme ene cero uno dos",
+    "o2768 a",
+    "be ce de 4 5 6",
+    "jota ka ele siete siete siete",
+    "la doble u ve uno dos tres cuatro",
+    "la i de griega a be uno dos tres",
+    "Transcribir exactamente cada carácter: A, B, C, 1, 2, 3.",
+    "placa ABC 123",
+    "ABC 123",
+    "erre ese te ocho nueve cero",
+    "pe cu erre uno uno dos",
+    "hache i jota cinco seis siete",
+    "a1234 be ce",
+    "efe ge hache dos dos dos",
+    "uno dos tres a be ce",
+    "dictado sin interpretarlo como palabras: te u ve 9 8 7",
+]
+
+
+def legacy_extract_chars(text: str) -> str:
+    """Copia del bucle original (sin prints ni validaciones finales)"""
+    words = clean_text(text).split()
+    chars = []
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word.lower() in SKIP_WORDS:
+            i += 1
+            continue
+        if i + 2 < len(words):
+            three_word = f"{word} {words[i + 1]} {words[i + 2]}"
+            if three_word in LETTERS:
+                chars.append(LETTERS[three_word])
+                i += 3
+                continue
+            elif three_word in NUM_WORDS:
+                chars.append(NUM_WORDS[three_word])
+                i += 3
+                continue
+        if i + 1 < len(words):
+            two_word = f"{word} {words[i + 1]}"
+            if two_word in LETTERS:
+                chars.append(LETTERS[two_word])
+                i += 2
+                continue
+            elif two_word in NUM_WORDS:
+                chars.append(NUM_WORDS[two_word])
+                i += 2
+                continue
+        if word in LETTERS:
+            chars.append(LETTERS[word])
+        elif word in NUM_WORDS:
+            chars.append(NUM_WORDS[word])
+        elif word.isdigit() and len(word) <= 4:
+            chars.extend(word)
+        elif word.isalpha() and len(word) <= 3:
+            chars.extend(list(word.upper()))
+        elif len(word) > 1 and word[0].isalpha() and word[1:].isdigit():
+            chars.append(LETTERS.get(word[0], word[0].upper()))
+            chars.extend(word[1:])
+        else:
+            corrected = word_correction(word)
+            if corrected:
+                chars.append(corrected)
+        i += 1
+    return ''.join(chars)
+
+
+def trie_extract_chars(text: str) -> str:
+    return stt_service.tokenize_plate_chars(text)[0]
+
+
+def load_corpus(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def timed(func, corpus: list, repeats: int = 200) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for text in corpus:
+                func(text)
+        elapsed = time.perf_counter() - started
+    return elapsed / (repeats * len(corpus))
+
+
+def main():
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else CORPUS
+    with contextlib.redirect_stdout(io.StringIO()):
+        pairs = [(text, legacy_extract_chars(text), trie_extract_chars(text)) for text in corpus]
+    legacy_time = timed(legacy_extract_chars, corpus)
+    trie_time = timed(trie_extract_chars, corpus)
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "corpus escrito a mano"
+    print(f"Transcripciones: {len(corpus)} ({source})")
+    print(f"Original (ventanas 3/2/1): {legacy_time * 1e6:8.1f} µs/texto")
+    print(f"Trie precompilado:         {trie_time * 1e6:8.1f} µs/texto")
+    print(f"Aceleración:               {legacy_time / trie_time:8.2f}x")
+    for text, legacy, trie in pairs:
+        if legacy != trie:
+            print(f"Difiere: {text!r}: {legacy!r} -> {trie!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Benchmark y verificación "golden": text_normalizer vs. las versiones originales
+de correct_common_errors y filter_problematic_text.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_text_normalizer
+
+Compara la salida sobre un conjunto fijo de transcripciones reales/plausibles y
+sobre textos aleatorios construidos con el vocabulario de las reglas (incluidos
+saltos de línea, mayúsculas y puntuación). Sale con error si alguna difiere.
+"""
+import random
+import re
+import sys
+import time
+
+import text_normalizer
+
+GOLDEN = [
+    "Sí, es correcto.",
+    "No, no es así.",
+    "uno dos tres",
+    "Es correcto, la placa es A B C uno dos tres.",
+    "Transcribir exactamente cada carácter dictado sin interpretarlo como palabras.",
+    "El usuario dicta una placa vehicular peruana: letras y números.",
+    "TU RESPUESTA CORTA EN ESPAÑOL: sí",
+    "TuRespuestaCortaEnEspañol sí claro",
+    "respuesta corta en español. Negativo.",
+    "¡Sí! ¿Correcto?",
+    "  - sí -  ",
+    "ese dos tres",
+    "te cinco seis siete",
+    "be uno",
+    "dieciséis diecisiete veinte",
+    "Dose, trez, quatro.",
+    "p uno",
+    "Cada uno como palabras",
+    "sinco seis",
+    "Placa vehicular ABC 123",
+    "la respuesta es sí\nusuario dicta algo",
+    "",
+    "   ",
+    "—",
+]
+
+
+def legacy_filter_problematic_text(text: str) -> str:
+    """Copia de la versión original (un re.sub sin compilar por patrón)"""
+    unwanted_patterns = [
+        r'TURESPUESTACORTAENESPAÑOL',
+        r'TU\s*RESPUESTA\s*CORTA\s*EN\s*ESPAÑOL',
+        r'RESPUESTA\s*CORTA\s*EN\s*ESPAÑOL',
+
+        # ELIMINAR COMPLETAMENTE EL PROMPT INICIAL Y VARIACIONES
+        r'usuario\s+dicta.*',
+        r'placa\s+vehicular.*',
+        r'transcribir\s+exactamente.*',
+        r'transcribir.*exactamente.*',
+        r'cada\s+carácter.*',
+        r'sin\s+interpretarlo.*',
+        r'como\s+palabras.*',
+        r'letras\s+y\s+números.*',
+
+        # PALABRAS SUELTAS DEL PROMPT SI APARECEN
+        r'\btranscribir\b',
+        r'\bexactamente\b',
+        r'\bcada\b',
+        r'\bcarácter\b',
+        r'\bdictado\b',
+        r'\binterpretarlo\b',
+        r'\bcomo\b',
+        r'\bpalabras\b',
+        r'\busuario\b',
+        r'\bvehicular\b',
+        r'\bperuana\b',
+    ]
+
+    cleaned = text
+    for pattern in unwanted_patterns:
+        cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE)
+
+    # Limpiar puntuación
+    cleaned = re.sub(r'[¡!¿?.,;:()"\'\[\]{}]', '', cleaned)
+    cleaned = re.sub(r'^[-\s]+|[-\s]+$', '', cleaned)
+    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+
+    return cleaned
+
+
+def legacy_correct_common_errors(text):
+    """Copia de la versión original (diccionarios por llamada, un re.sub por palabra)"""
+    numbers_to_digits = {
+        'cero': '0', 'zero': '0',
+        'uno': '1', 'una': '1',
+        'dos': '2', 'dose': '2',
+        'tres': '3', 'tree': '3',
+        'cuatro': '4', 'quatro': '4',
+        'cinco': '5', 'zinco': '5',
+        'seis': '6', 'ses': '6',
+        'siete': '7', 'siebe': '7',
+        'ocho': '8', 'hoco': '8',
+        'nueve': '9', 'nuebe': '9',
+        'diez': '10', 'dies': '10',
+        'once': '11', 'onze': '11',
+        'doce': '12', 'doze': '12',
+        'trece': '13', 'treze': '13',
+        'catorce': '14', 'quatorze': '14',
+        'quince': '15', 'quinze': '15',
+        'dieciséis': '16', 'dieciseis': '16',
+        'diecisiete': '17', 'diecisiebe': '17',
+        'dieciocho': '18', 'diecioco': '18',
+        'diecinueve': '19', 'diecinuebe': '19',
+        'veinte': '20', 'beinte': '20',
+    }
+    
+    corrections_e = {
+        'p': 'e', 'P': 'E',
+        'be': 'e', 'pe': 'e', 'se': 'e', 'te': 'e',
+        'esé': 'e', 'ese': 'e', 'ete': 'e', 'erre': 'e',
+        'he': 'e', 'ye': 'e', 'de': 'e', 'le': 'e',
+        'me': 'e', 'ne': 'e', 're': 'e', 've': 'e',
+        'ce': 'e', 'ge': 'e', 'je': 'e', 'ke': 'e',
+        'que': 'e', 'qe': 'e', 'eh': 'e', 'ay': 'e',
+        'ei': 'e', 'ie': 'e', 'ae': 'e', 'ea': 'e'
+    }
+    
+    corrections_s = {
+        'es': 's', 'se': 's', 'ze': 's', 'ce': 's',
+        'ps': 's', 'hs': 's', 'ss': 's', 'sz': 's',
+        'as': 's', 'is': 's', 'os': 's', 'us': 's',
+        'eso': 's', 'esa': 's', 'esi': 's', 'esu': 's',
+        'si': 's', 'sy': 's', 'ts': 's', 'xs': 's',
+        'cs': 's', 'ds': 's', 'fs': 's', 'gs': 's'
+    }
+    
+    corrections_t = {
+        'te': 't', 'et': 't', 'th': 't', 'ht': 't',
+        'pt': 't', 'tt': 't', 'dt': 't', 'ct': 't',
+        'at': 't', 'it': 't', 'ot': 't', 'ut': 't',
+        'to': 't', 'ta': 't', 'ti': 't', 'tu': 't',
+        'ty': 't', 'tr': 't', 'st': 't', 'xt': 't',
+        'ft': 't', 'gt': 't', 'kt': 't', 'lt': 't',
+        'mt': 't', 'nt': 't', 'rt': 't', 'wt': 't',
+        'ta': 't'
+    }
+    
+    corrected = text.lower().strip()
+    
+    for word_num, digit in numbers_to_digits.items():
+        corrected = re.sub(r'\b' + word_num + r'\b', digit, corrected)
+    words = corrected.split()
+    if words:
+        first_word = words[0]
+        if first_word in corrections_e:
+            words[0] = corrections_e[first_word]
+        elif first_word in corrections_s:
+            words[0] = corrections_s[first_word]
+        elif first_word in corrections_t:
+            words[0] = corrections_t[first_word]
+    
+    return ' '.join(words) if words else corrected
+
+
+WORDS = (list(text_normalizer.NUMBERS_TO_DIGITS) + list(text_normalizer.FIRST_WORD_CORRECTIONS)
+         + text_normalizer.PROMPT_WORDS
+         + ["usuario dicta", "placa vehicular", "transcribir exactamente", "cada carácter",
+            "sin interpretarlo", "como palabras", "letras y números", "RESPUESTA CORTA EN ESPAÑOL",
+            "Tu respuesta", "TURESPUESTACORTAENESPAÑOL", "sí", "no", "es", "correcto", "Dicta",
+            "UNO", "Cero", "abc", "123", "x"])
+SEPARATORS = [" ", "  ", ", ", ". ", "-", "", "¿", "?", "¡", "!", "\n", ":", "\t", "'"]
+
+
+def random_text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 12)):
+        word = rng.choice(WORDS)
+        if rng.random() < 0.2:
+            word = word.upper()
+        parts.append(word)
+        parts.append(rng.choice(SEPARATORS))
+    return "".join(parts)
+
+
+def timed(func, texts, repeats: int = 20) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - started) / (repeats * len(texts))
+
+
+def main():
+    rng = random.Random(0)
+    texts = GOLDEN + [random_text(rng) for _ in range(20000)]
+
+    mismatches = 0
+    pairs = [
+        ("filter_problematic_text", legacy_filter_problematic_text, text_normalizer.filter_problematic_text),
+        ("correct_common_errors", legacy_correct_common_errors, text_normalizer.correct_common_errors),
+    ]
+    for name, legacy, current in pairs:
+        for text in texts:
+            expected, got = legacy(text), current(text)
+            if expected != got:
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"{name} difiere en {text!r}: {expected!r} != {got!r}")
+
+    sample = texts[:2000]
+    for name, legacy, current in pairs:
+        legacy_time = timed(legacy, sample)
+        current_time = timed(current, sample)
+        print(f"{name:24s} original {legacy_time * 1e6:7.1f} µs  compilado {current_time * 1e6:6.1f} µs  "
+              f"({legacy_time / current_time:.1f}x)")
+    print(f"Textos comparados: {len(texts)}, diferencias: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
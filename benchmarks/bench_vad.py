@@ -0,0 +1,118 @@
+"""
+Benchmark: VAD vectorizado (utils.vad_segments) vs. el colector original por tramas.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_vad                # grabación sintética de 10 minutos
+    python -m benchmarks.bench_vad audio.wav      # WAV PCM 16-bit mono (8/16/32/48 kHz)
+
+Además del tiempo verifica que ambos devuelvan exactamente los mismos segmentos.
+"""
+import collections
+import sys
+import time
+import wave
+
+import numpy as np
+import webrtcvad
+
+import utils
+
+FRAME_DURATION_MS = 30
+PADDING_DURATION_MS = 300
+
+
+def legacy_vad_collector(sample_rate, frame_duration_ms, padding_duration_ms, audio, detector):
+    """Copia de la implementación original (bucle por trama + recuento del ring buffer)"""
+    frames = utils.frame_generator(frame_duration_ms, audio, sample_rate)
+    num_padding_frames = int(padding_duration_ms / frame_duration_ms)
+    ring_buffer = collections.deque(maxlen=num_padding_frames)
+    triggered = False
+    voiced_frames = []
+    for frame in frames:
+        is_speech = detector.is_speech(frame, sample_rate)
+        if not triggered:
+            ring_buffer.append((frame, is_speech))
+            num_voiced = len([f for f, speech in ring_buffer if speech])
+            if num_voiced > 0.9 * ring_buffer.maxlen:
+                triggered = True
+                for f, s in ring_buffer:
+                    voiced_frames.append(f)
+                ring_buffer.clear()
+        else:
+            voiced_frames.append(frame)
+            ring_buffer.append((frame, is_speech))
+            num_unvoiced = len([f for f, speech in ring_buffer if not speech])
+            if num_unvoiced > 0.9 * ring_buffer.maxlen:
+                triggered = False
+                yield b''.join(voiced_frames)
+                ring_buffer.clear()
+                voiced_frames = []
+    if voiced_frames:
+        yield b''.join(voiced_frames)
+
+
+def synthetic_recording(seconds: int = 600, sample_rate: int = 16000) -> bytes:
+    """Alterna tramos tipo voz (armónicos modulados) con silencio y ruido de fondo"""
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * sample_rate) / sample_rate
+    audio = rng.normal(0, 80, t.size)
+    position = 0
+    while position < t.size:
+        speech = int(rng.uniform(0.4, 3.0) * sample_rate)
+        pause = int(rng.uniform(0.2, 2.0) * sample_rate)
+        end = min(position + speech, t.size)
+        tt = t[position:end]
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * tt) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * tt)
+        audio[position:end] += 6000 * voiced * envelope
+        position = end + pause
+    return np.clip(audio, -32768, 32767).astype(np.int16).tobytes()
+
+
+def load_wav(path: str):
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+            raise SystemExit("Se requiere WAV PCM 16-bit mono")
+        return wf.readframes(wf.getnframes()), wf.getframerate()
+
+
+def timed(func, repeats: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    if len(sys.argv) > 1:
+        audio, sample_rate = load_wav(sys.argv[1])
+    else:
+        sample_rate = 16000
+        audio = synthetic_recording(sample_rate=sample_rate)
+    duration = len(audio) / (2 * sample_rate)
+
+    # webrtcvad guarda estado entre llamadas: cada corrida usa una instancia nueva
+    legacy_time, legacy = timed(lambda: list(legacy_vad_collector(
+        sample_rate, FRAME_DURATION_MS, PADDING_DURATION_MS, audio, webrtcvad.Vad(2))))
+    vector_time, offsets = timed(lambda: utils.vad_segments(
+        sample_rate, FRAME_DURATION_MS, PADDING_DURATION_MS, audio, webrtcvad.Vad(2)))
+    flags_time, _ = timed(lambda: utils.speech_flags(
+        audio, sample_rate, FRAME_DURATION_MS, webrtcvad.Vad(2)))
+
+    vectorized = [audio[start:end] for start, end in offsets]
+    print(f"Audio: {duration:.0f}s, {len(legacy)} segmentos")
+    print(f"Original (por trama):  {legacy_time * 1000:8.1f} ms")
+    print(f"Vectorizado:           {vector_time * 1000:8.1f} ms "
+          f"(de ellos webrtcvad: {flags_time * 1000:.1f} ms)")
+    print(f"Aceleración:           {legacy_time / vector_time:8.2f}x")
+    print(f"Segmentos idénticos:   {vectorized == legacy}")
+    if vectorized != legacy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Límites de concurrencia por subsistema (STT, TTS).
+
+Todo el trabajo bloqueante (modelos, subprocesos, archivos) se ejecuta fuera
+del event loop. Cada subsistema admite ``max_concurrent`` ejecuciones
+simultáneas y una cola de espera acotada; si la cola está llena o la espera
+supera ``queue_timeout`` se lanza ``OverloadedError`` y la API responde 503
+con Retry-After, en lugar de dejar crecer la latencia de cola.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterator
+
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+
+
+class OverloadedError(Exception):
+    """El subsistema no admite más trabajo en este momento"""
+
+    def __init__(self, subsystem: str, retry_after: int):
+        super().__init__(f"{subsystem} saturado")
+        self.subsystem = subsystem
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Semáforo con cola de espera acotada y métricas básicas"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int,
+                 queue_timeout: float = 10.0, retry_after: int = 1):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(self.name, self.retry_after)
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError(self.name, self.retry_after)
+        finally:
+            self.waiting -= 1
+        self.total_wait += time.perf_counter() - started
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    @property
+    def busy(self) -> bool:
+        """True si no hay cupos libres (útil para descartar trabajo opcional)"""
+        return self._semaphore.locked()
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Ejecuta func en el threadpool cuando hay un cupo libre"""
+        async with self.slot():
+            return await run_in_threadpool(func, *args, **kwargs)
+
+    async def stream(self, iterator: Iterator) -> AsyncIterator:
+        """Recorre un iterador bloqueante en el threadpool ocupando un cupo hasta agotarlo"""
+        async with self.slot():
+            async for item in iterate_in_threadpool(iterator):
+                yield item
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_queue_wait_ms": round(self.total_wait * 1000 / self.completed, 2) if self.completed else 0.0,
+        }
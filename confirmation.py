@@ -0,0 +1,44 @@
+"""
+Detección de intención sí/no en respuestas de confirmación.
+
+``IntentMatcher`` compila todas las frases afirmativas y negativas en una sola
+alternancia ordenada de la más larga a la más corta: el primer match del texto
+es el de más a la izquierda y, en esa posición, la frase más larga. Así "no es
+así" se reconoce como negativa en lugar de encontrar primero "es así".
+
+La confianza (log-probabilidad media de los segmentos de Whisper) se adjunta
+al resultado y permite marcar confirmaciones dudosas sin volver a decodificar.
+"""
+import re
+from collections import namedtuple
+from typing import Iterable, Optional
+
+# polarity: True (sí), False (no) o None; start/end sobre el texto en minúsculas
+Intent = namedtuple("Intent", ["polarity", "phrase", "start", "end", "confidence", "low_confidence"])
+
+
+class IntentMatcher:
+    """Alternancia precompilada de frases sí/no con match más a la izquierda y más largo"""
+
+    def __init__(self, affirmative: Iterable[str], negative: Iterable[str],
+                 min_logprob: float = -0.5):
+        self.min_logprob = min_logprob
+        self._polarity = {phrase.lower(): True for phrase in affirmative}
+        self._polarity.update({phrase.lower(): False for phrase in negative})
+        phrases = sorted(self._polarity, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, phrases)) + r")\b")
+
+    def match(self, text: str, confidence: Optional[float] = None) -> Intent:
+        """Intención del texto; confidence es la log-probabilidad media de la transcripción"""
+        low_confidence = confidence is not None and confidence < self.min_logprob
+        found = self.pattern.search(text.lower())
+        if found is None:
+            return Intent(None, None, None, None, confidence, low_confidence)
+        phrase = found.group()
+        return Intent(self._polarity[phrase], phrase, found.start(), found.end(),
+                      confidence, low_confidence)
+
+
+def average_logprob(logprobs: Iterable[float]) -> Optional[float]:
+    values = list(logprobs)
+    return sum(values) / len(values) if values else None
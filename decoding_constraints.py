@@ -0,0 +1,81 @@
+"""
+Restricción del vocabulario de salida de Whisper para el dictado de placas.
+
+Whisper acepta una lista de tokens a suprimir (``suppress_tokens``): su
+logit se anula en cada paso de la decodificación. Aquí se calcula el
+complemento del vocabulario de placas: se permiten solo los tokens que
+aparecen al codificar las palabras deletreadas (letras, números, con y sin
+espacio inicial y en minúscula/mayúscula) y los tokens formados únicamente por
+dígitos, espacios o separadores. Todo lo demás queda suprimido, así que la
+salida ya viene en el vocabulario que entiende el parser y es más corta.
+
+El cálculo recorre el vocabulario completo del tokenizer una vez por proceso;
+el resultado se reutiliza en todas las peticiones. Las opciones de
+decodificación llevan solo las palabras permitidas (``VOCABULARY_OPTION``) y
+``resolve_vocabulary`` las convierte en ``suppress_tokens`` junto al modelo que
+decodifica (en el proceso de la API o en cada worker), así la lista de ~50k ids
+no viaja con cada trabajo. faster-whisper extiende en sitio la lista que recibe,
+por lo que cada llamada recibe una copia nueva de la tupla cacheada.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+from faster_whisper.tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Caracteres que pueden formar tokens permitidos por sí solos (dígitos y separadores)
+FREE_CHARACTERS = frozenset("0123456789 ,.-")
+# Opción propia: tupla de palabras permitidas, sustituida por suppress_tokens antes de decodificar
+VOCABULARY_OPTION = "vocabulary"
+
+_suppressed_cache: Dict[Tuple[Tuple[str, ...], int], Tuple[int, ...]] = {}
+_suppressed_lock = threading.Lock()
+
+
+def vocabulary_token_ids(tokenizer, words: Iterable[str]) -> Set[int]:
+    """Ids de todos los tokens usados al codificar cada palabra en sus variantes habituales"""
+    ids: Set[int] = set()
+    for word in words:
+        for form in {word, word.capitalize(), word.upper()}:
+            ids.update(tokenizer.encode(form))
+            ids.update(tokenizer.encode(" " + form))
+    return ids
+
+
+def suppress_tokens_outside(tokenizer, words: Iterable[str]) -> List[int]:
+    """Tokens de texto (< eot) que no pertenecen al vocabulario dado ni son dígitos/separadores"""
+    started = time.perf_counter()
+    allowed = vocabulary_token_ids(tokenizer, words)
+    suppressed = []
+    for token in range(tokenizer.eot):
+        if token in allowed:
+            continue
+        text = tokenizer.decode([token])
+        if text and FREE_CHARACTERS.issuperset(text):
+            continue
+        suppressed.append(token)
+    logger.info("Vocabulario restringido: %d tokens permitidos, %d suprimidos (%.2fs)",
+                tokenizer.eot - len(suppressed), len(suppressed), time.perf_counter() - started)
+    return suppressed
+
+
+def resolve_vocabulary(options: dict, model) -> dict:
+    """Opciones para model.transcribe(): VOCABULARY_OPTION pasa a suppress_tokens (lista nueva por llamada)"""
+    words = options.get(VOCABULARY_OPTION)
+    if words is None:
+        return options
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                          task="transcribe", language=options.get("language") or "es")
+    key = (words, tokenizer.eot)
+    suppressed = _suppressed_cache.get(key)
+    if suppressed is None:
+        with _suppressed_lock:
+            suppressed = _suppressed_cache.get(key)
+            if suppressed is None:
+                suppressed = _suppressed_cache[key] = tuple(suppress_tokens_outside(tokenizer, words))
+    resolved = {name: value for name, value in options.items() if name != VOCABULARY_OPTION}
+    resolved["suppress_tokens"] = list(suppressed)
+    return resolved
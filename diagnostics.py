@@ -0,0 +1,124 @@
+"""
+Diagnóstico estructurado por petición y logging no bloqueante.
+
+En lugar de ``print`` en cada patrón, validación y dígito, el código de
+extracción registra eventos con ``trace_event`` sobre la traza de la petición
+en curso (guardada en una ContextVar). Si no hay traza activa, la llamada
+retorna de inmediato: no se formatea nada ni se escribe en stdout. Los valores
+costosos pueden pasarse como callables y solo se evalúan al exportar.
+
+La traza se activa por petición (``start_trace(..., enabled=True)``, p. ej.
+con ``?trace=1`` en la API) o para todas con ``STT_TRACE=log``. Al cerrarse se
+emite como una sola línea JSON en el logger "diagnostics" (modo log) y queda
+disponible como dict para devolverla en la respuesta.
+
+``setup_logging`` instala un QueueHandler en el logger raíz: los hilos de la
+API solo encolan registros y un QueueListener los escribe en segundo plano.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# off: solo trazas pedidas explícitamente; log: todas las peticiones emiten su línea JSON
+TRACE_MODE = os.getenv("STT_TRACE", "off").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+
+trace_logger = logging.getLogger("diagnostics")
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("stt_trace", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestTrace:
+    """Eventos de una petición con tiempo relativo; los valores callables se evalúan al exportar"""
+
+    __slots__ = ("name", "started", "events", "fields")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.events = []
+        self.fields = {}
+
+    def event(self, event: str, values: dict) -> None:
+        self.events.append((time.perf_counter() - self.started, event, values))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            **{key: _resolve(value) for key, value in self.fields.items()},
+            "events": [
+                {"t_ms": round(elapsed * 1000, 2), "event": event,
+                 **{key: _resolve(value) for key, value in values.items()}}
+                for elapsed, event, values in self.events
+            ],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+
+
+def _resolve(value):
+    return value() if callable(value) else value
+
+
+def trace_event(event: str, **values) -> None:
+    """Registra un evento en la traza activa (no hace nada si no hay traza)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.event(event, values)
+
+
+def trace_fields(**values) -> None:
+    """Campos de resumen de la petición (texto crudo, placa, confianza...)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.fields.update(values)
+
+
+def tracing() -> bool:
+    """True si hay una traza activa (para evitar trabajo que solo sirve al diagnóstico)"""
+    return _current_trace.get() is not None
+
+
+@contextmanager
+def start_trace(name: str, enabled: bool = False):
+    """Abre la traza de la petición; entrega None si el diagnóstico está desactivado"""
+    if not (enabled or TRACE_MODE == "log"):
+        yield None
+        return
+    trace = RequestTrace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if TRACE_MODE == "log" and trace_logger.isEnabledFor(logging.INFO):
+            trace_logger.info(trace.to_json())
+
+
+def setup_logging(level: str = LOG_LEVEL) -> None:
+    """Logger raíz con QueueHandler + QueueListener (idempotente)"""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+    if TRACE_MODE == "log":
+        trace_logger.setLevel(logging.INFO)
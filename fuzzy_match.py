@@ -0,0 +1,147 @@
+"""
+Corrección difusa de palabras contra el vocabulario de placas.
+
+``FuzzyIndex`` se construye una sola vez a partir del vocabulario y resuelve
+cada palabra en tres pasos:
+
+1. Clave fonética española (``phonetic_key``): "sinco" y "cinco" comparten
+   clave, de modo que los errores típicos de audición se resuelven con una
+   consulta a diccionario. Solo se usan claves que no sean ambiguas.
+2. Índice invertido de caracteres: acota en una pasada la similitud máxima
+   posible de cada candidato (la misma cota que ``difflib.quick_ratio``) y
+   descarta los que no pueden llegar al umbral.
+3. ``SequenceMatcher.ratio`` sobre los candidatos que sobreviven, en orden de
+   cota decreciente y deteniéndose cuando ninguno puede superar al mejor; el
+   resultado y el desempate son los de ``difflib.get_close_matches``.
+
+Los resultados se memorizan (LRU), ya que Whisper repite los mismos errores.
+"""
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+_ACCENTS = str.maketrans("áéíóúü", "aeiouu")
+
+
+def phonetic_key(word: str) -> str:
+    """Clave fonética aproximada del español (seseo, b/v, h muda, ll/y, c/qu/k, g/j)"""
+    word = unicodedata.normalize("NFC", word.lower()).translate(_ACCENTS)
+    out = []
+    i = 0
+    n = len(word)
+    while i < n:
+        c = word[i]
+        nxt = word[i + 1] if i + 1 < n else ""
+        if c == "c":
+            if nxt == "h":
+                out.append("ch")
+                i += 2
+                continue
+            out.append("s" if nxt in ("e", "i") else "k")
+        elif c == "q":
+            out.append("k")
+            if nxt == "u":
+                i += 1
+        elif c == "g":
+            out.append("j" if nxt in ("e", "i") else "g")
+            if nxt == "u" and i + 2 < n and word[i + 2] in ("e", "i"):
+                i += 1
+        elif c == "l" and nxt == "l":
+            out.append("y")
+            i += 1
+        elif c == "h":
+            pass
+        else:
+            out.append({"v": "b", "z": "s", "w": "b", "x": "ks"}.get(c, c))
+        i += 1
+
+    # Letras dobles ("rr" se conserva: distingue "pero"/"perro")
+    key = []
+    for part in out:
+        if key and part == key[-1] and part != "r":
+            continue
+        key.append(part)
+    return "".join(key)
+
+
+class FuzzyIndex:
+    """Índice precalculado para corregir palabras no reconocidas contra un vocabulario"""
+
+    def __init__(self, vocabulary: Dict[str, str], cutoff: float = 0.7, cache_size: int = 4096):
+        self.vocabulary = dict(vocabulary)
+        self.cutoff = cutoff
+
+        # Clave fonética -> valor (None si la clave corresponde a valores distintos)
+        phonetic: Dict[str, Optional[str]] = {}
+        for phrase, value in self.vocabulary.items():
+            key = phonetic_key(phrase)
+            if key in phonetic and phonetic[key] != value:
+                phonetic[key] = None
+            else:
+                phonetic[key] = value
+        self._phonetic = {key: value for key, value in phonetic.items() if value is not None}
+
+        # Carácter -> [(índice de candidato, ocurrencias)]
+        self._candidates = list(self.vocabulary)
+        self._lengths = [len(candidate) for candidate in self._candidates]
+        self._postings = defaultdict(list)
+        for index, candidate in enumerate(self._candidates):
+            for char, count in Counter(candidate).items():
+                self._postings[char].append((index, count))
+
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def best_match(self, word: str) -> Optional[Tuple[str, float]]:
+        """(frase, similitud) más parecida con similitud >= cutoff, igual que get_close_matches(n=1)"""
+        if not word:
+            return None
+        shared: Dict[int, int] = {}
+        for char, count in Counter(word).items():
+            for index, candidate_count in self._postings.get(char, ()):
+                shared[index] = shared.get(index, 0) + min(count, candidate_count)
+
+        # Cota superior de similitud por candidato (real_quick_ratio y quick_ratio de difflib)
+        length = len(word)
+        bounds = []
+        for index, common in shared.items():
+            total = length + self._lengths[index]
+            bound = 2.0 * min(common, length, self._lengths[index]) / total
+            if bound >= self.cutoff:
+                bounds.append((bound, index))
+        bounds.sort(reverse=True)
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(word)
+        best = None
+        for bound, index in bounds:
+            # Ningún candidato restante puede superar (ni empatar por debajo) al mejor
+            if best is not None and bound < best[0]:
+                break
+            candidate = self._candidates[index]
+            matcher.set_seq1(candidate)
+            score = matcher.ratio()
+            if score >= self.cutoff and (best is None or (score, candidate) > best):
+                best = (score, candidate)
+        return (best[1], best[0]) if best else None
+
+    def _lookup(self, word: str) -> Optional[str]:
+        value = self.vocabulary.get(word)
+        if value is not None:
+            return value
+        value = self._phonetic.get(phonetic_key(word))
+        if value is not None:
+            return value
+        match = self.best_match(word)
+        return self.vocabulary[match[0]] if match else None
+
+    def stats(self) -> dict:
+        info = self.lookup.cache_info()
+        return {
+            "vocabulary": len(self._candidates),
+            "phonetic_keys": len(self._phonetic),
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
+            "cache_size": info.currsize,
+        }
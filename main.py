@@ -1,15 +1,20 @@
 import os
-import uuid
 import asyncio
 from pathlib import Path
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Form, HTTPException, Request
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import time
 import logging
-from stt_service import transcribe_optimized, transcribe_general
-from tts_service import synthesize
-from fastapi.concurrency import run_in_threadpool
+from stt_service import transcribe_optimized, transcribe_general, transcribe_partial, get_stats as get_stt_stats
+from tts_service import (synthesize_bytes, synthesize_stream, synthesize_plate_confirmation, prewarm,
+                         prepare_plate_concatenation, cache as tts_cache, PIPER_PRELOAD)
+from stt_workers import STTOverloadedError
+from concurrency import ConcurrencyLimiter, OverloadedError
+from utils import vad_pool, pcm16_to_float32
+from model_registry import registry
+from uploads import read_upload, upload_openapi, UploadTooLargeError, UploadFormatError
+from audio_formats import FORMATS, WAV, OPUS, OutputFormat, negotiate
 # from tts_service_aux import synthesize_alternative
 app = FastAPI(title="Sistema de Reconocimiento de Placas Peruanas")
 app.add_middleware(
@@ -23,145 +28,331 @@ app.add_middleware(
 SAMPLE_RATE = 16000
 FRAME_DURATION_MS = 30
 PADDING_DURATION_MS = 300
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
-os.makedirs("temp_audio", exist_ok=True)
-os.makedirs("audio_out", exist_ok=True)
-@app.post("/stt")
-async def stt_endpoint(audio: UploadFile = File(...)):
+
+# "background": los modelos se cargan y calientan tras arrancar (readiness espera a que terminen);
+# "lazy": cada modelo se carga con la primera petición que lo necesita
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "background")
+
+# Resultados intermedios en /ws/stt (también activables con ?interim=1)
+INTERIM_RESULTS = os.getenv("STT_INTERIM_RESULTS", "0") == "1"
+INTERIM_INTERVAL_MS = int(os.getenv("STT_INTERIM_INTERVAL_MS", "600"))
+INTERIM_MIN_AUDIO_MS = 500
+INTERIM_STABLE_COUNT = int(os.getenv("STT_INTERIM_STABLE_COUNT", "2"))
+
+# /tts en streaming oración por oración (también activable con ?stream=1)
+TTS_STREAMING = os.getenv("TTS_STREAMING", "0") == "1"
+
+# Formato por defecto cuando el cliente no pide uno en Accept (wav u opus)
+TTS_DEFAULT_FORMAT = FORMATS.get(os.getenv("TTS_DEFAULT_FORMAT", "wav"), WAV)
+PLATE_AUDIO_FORMAT = FORMATS.get(os.getenv("PLATE_AUDIO_FORMAT", "opus"), OPUS)
+
+# Mensajes de voz fijos: se sintetizan al arrancar para servirse desde la caché TTS
+MSG_FILE_TOO_LARGE = "Archivo de audio muy grande, intente de nuevo por favor"
+MSG_TECHNICAL_ERROR = "Error técnico, intente de nuevo por favor"
+PREWARM_PROMPTS = [
+    MSG_FILE_TOO_LARGE,
+    MSG_TECHNICAL_ERROR,
+    "No pude determinar la matrícula",
+    "No se detectó voz clara en el audio",
+    "Error técnico en el procesamiento",
+    "El archivo de audio está vacío",
+]
+# Documentación del cuerpo multipart: los endpoints leen el archivo del stream, no con File(...)
+AUDIO_UPLOAD_OPENAPI = upload_openapi("audio")
+
+# Límites por subsistema: ejecuciones simultáneas + cola acotada; el exceso recibe 503
+stt_limiter = ConcurrencyLimiter(
+    "STT",
+    max_concurrent=int(os.getenv("STT_MAX_CONCURRENT", "4")),
+    max_queue=int(os.getenv("STT_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("STT_QUEUE_TIMEOUT", "10")),
+    retry_after=2
+)
+tts_limiter = ConcurrencyLimiter(
+    "TTS",
+    max_concurrent=int(os.getenv("TTS_MAX_CONCURRENT", "2")),
+    max_queue=int(os.getenv("TTS_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("TTS_QUEUE_TIMEOUT", "10")),
+    retry_after=1
+)
+
+
+def warm_tts():
+    prewarm(PREWARM_PROMPTS, formats=(WAV, PLATE_AUDIO_FORMAT))
+    try:
+        prepare_plate_concatenation()
+    except Exception as e:
+        logging.error(f"No se pudieron preparar los clips de placa: {e}")
+
+
+@app.on_event("startup")
+async def prewarm_tts_cache():
+    # En segundo plano: no retrasa el arranque del servidor
+    if MODEL_PRELOAD == "background":
+        registry.start_background()
+    if PIPER_PRELOAD:
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, warm_tts)
+
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """200 cuando los modelos de precarga están cargados y calentados; 503 mientras tanto"""
+    models = registry.stats()
+    ready = MODEL_PRELOAD == "lazy" or registry.ready()
+    if ready:
+        status = "ready"
+    elif any(model["state"] == "failed" for model in models.values() if model["preload"]):
+        status = "failed"
+    else:
+        status = "loading"
+    return JSONResponse(status_code=200 if ready else 503, content={"status": status, "models": models})
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request, exc: OverloadedError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Servicio {exc.subsystem} saturado, intente de nuevo"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(STTOverloadedError)
+async def stt_overloaded_handler(request, exc: STTOverloadedError):
+    return await overloaded_handler(request, OverloadedError("STT", stt_limiter.retry_after))
+
+
+def audio_response(audio: bytes, fmt: OutputFormat, name: str, headers: dict = None) -> Response:
+    """Respuesta de audio servida desde memoria; tipo y extensión según el formato negociado"""
+    response_headers = {"Content-Disposition": f"attachment; filename={name}.{fmt.extension}", "Vary": "Accept"}
+    response_headers.update(headers or {})
+    return Response(content=audio, media_type=fmt.media_type, headers=response_headers)
+
+
+async def streaming_audio_response(chunks, media_type: str, headers: dict = None) -> StreamingResponse:
+    """Respuesta chunked; el primer bloque se genera antes de responder para que los errores sigan siendo 500/503"""
+    first = await chunks.__anext__()
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
+@app.post("/stt", openapi_extra=AUDIO_UPLOAD_OPENAPI)
+async def stt_endpoint(request: Request, trace: bool = False):
     start_time = time.time()
-    temp_path = None
     try:
-        content = await audio.read()
-        if len(content) > MAX_FILE_SIZE:
+        try:
+            content = await read_upload(request, "audio", MAX_FILE_SIZE)
+        except UploadTooLargeError:
             raise HTTPException(status_code=413, detail="Archivo muy grande (máximo 25MB)")
+        except UploadFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         if len(content) == 0:
             raise HTTPException(status_code=400, detail="Archivo vacío")
-        temp_path = f"temp_audio/{uuid.uuid4()}.wav"
-        with open(temp_path, "wb") as f:
-            f.write(content)
-        result = await run_in_threadpool(transcribe_optimized, temp_path)
+        result = await stt_limiter.run(transcribe_optimized, content, trace)
         logging.info(f"STT procesado en {result.get('processing_time', 0):.2f}s")
         return result
-    except HTTPException:
+    except (HTTPException, OverloadedError, STTOverloadedError):
         raise
     except Exception as e:
         logging.error(f"Error en STT: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-@app.post("/speech_to_text/transcribe")
-async def stt_endpoint(audio: UploadFile = File(...)):
+@app.post("/speech_to_text/transcribe", openapi_extra=AUDIO_UPLOAD_OPENAPI)
+async def stt_endpoint(request: Request, trace: bool = False):
     start_time = time.time()
-    temp_path = None
     try:
-        content = await audio.read()
-        if len(content) > MAX_FILE_SIZE:
+        try:
+            content = await read_upload(request, "audio", MAX_FILE_SIZE)
+        except UploadTooLargeError:
             raise HTTPException(status_code=413, detail="Archivo muy grande (máximo 25MB)")
+        except UploadFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         if len(content) == 0:
             raise HTTPException(status_code=400, detail="Archivo vacío")
-        temp_path = f"temp_audio/{uuid.uuid4()}.wav"
-        with open(temp_path, "wb") as f:
-            f.write(content)
-        result = transcribe_general(temp_path)
+        result = await stt_limiter.run(transcribe_general, content, trace)
         logging.info(f"STT procesado en {result.get('processing_time', 0):.2f}s")
         return result
-    except HTTPException:
+    except (HTTPException, OverloadedError, STTOverloadedError):
         raise
     except Exception as e:
         logging.error(f"Error en STT: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
 
 
 @app.post("/tts")
-async def tts_endpoint(text: str = Form(...)):
+async def tts_endpoint(request: Request, text: str = Form(...), stream: bool = TTS_STREAMING):
     try:
         if not text.strip():
             raise HTTPException(status_code=400, detail="Texto vacío")
 
-        audio_path = synthesize(text)
-        media_type = "audio/wav"
-        filename = "output.wav"
-
-        # AGREGAR: Configurar headers para eliminación automática
-        return FileResponse(
-            audio_path,
-            media_type=media_type,
-            filename=filename,
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Cache-Control": "no-cache, no-store, must-revalidate"
-            }
+        if stream:
+            return await streaming_audio_response(
+                tts_limiter.stream(synthesize_stream(text)),
+                media_type="audio/wav",
+                headers={"Cache-Control": "no-cache, no-store, must-revalidate"}
+            )
+        fmt = negotiate(request.headers.get("accept"), TTS_DEFAULT_FORMAT)
+        audio_bytes = await tts_limiter.run(synthesize_bytes, text, fmt)
+        return audio_response(
+            audio_bytes,
+            fmt,
+            "output",
+            headers={"Cache-Control": "no-cache, no-store, must-revalidate"}
         )
+    except (HTTPException, OverloadedError):
+        raise
     except Exception as e:
         logging.error(f"Error en TTS: {e}")
         raise HTTPException(status_code=500, detail="Error en síntesis de voz")
-@app.post("/process_plate")
-async def process_plate_endpoint(audio: UploadFile = File(...)):
-    temp_path = None
+@app.post("/process_plate", openapi_extra=AUDIO_UPLOAD_OPENAPI)
+async def process_plate_endpoint(request: Request):
+    fmt = negotiate(request.headers.get("accept"), PLATE_AUDIO_FORMAT)
     try:
-        content = await audio.read()
-        if len(content) > MAX_FILE_SIZE:
-            error_audio = synthesize("Archivo de audio muy grande, intente de nuevo por favor")
-            return FileResponse(error_audio, media_type="audio/ogg", filename="error.wav")
-        temp_path = f"temp_audio/{uuid.uuid4()}.wav"
-        with open(temp_path, "wb") as f:
-            f.write(content)
-        result = transcribe_optimized(temp_path)
+        try:
+            content = await read_upload(request, "audio", MAX_FILE_SIZE)
+        except UploadTooLargeError:
+            error_audio = await tts_limiter.run(synthesize_bytes, MSG_FILE_TOO_LARGE, fmt)
+            return audio_response(error_audio, fmt, "error")
+        result = await stt_limiter.run(transcribe_optimized, content)
         if result["success"]:
-            response_text = f"¿Usted dijo {result['plate']}?"
+            response_audio = await tts_limiter.run(synthesize_plate_confirmation, result["plate"], fmt)
         else:
-            response_text = result["message"]
-        response_audio = synthesize(response_text)
-        return FileResponse(
+            response_audio = await tts_limiter.run(synthesize_bytes, result["message"], fmt)
+        return audio_response(
             response_audio,
-            media_type="audio/ogg",
-            filename="response.opus",
+            fmt,
+            "response",
             headers={
                 "X-Plate-Detected": str(result["success"]),
                 "X-Plate-Value": result["plate"] or "",
                 "X-Processing-Time": str(result["processing_time"])
             }
         )
+    except (OverloadedError, STTOverloadedError):
+        raise
     except Exception as e:
-        error_audio = synthesize("Error técnico, intente de nuevo por favor")
-        return FileResponse(error_audio, media_type="audio/ogg", filename="error.opus")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
+        logging.error(f"Error en process_plate: {e}")
+        error_audio = await tts_limiter.run(synthesize_bytes, MSG_TECHNICAL_ERROR, fmt)
+        return audio_response(error_audio, fmt, "error")
+@app.get("/stt/stats")
+async def stt_stats():
+    return {**get_stt_stats(), "limiter": stt_limiter.stats(), "vad_pool": vad_pool.stats()}
+@app.get("/tts/cache")
+async def tts_cache_stats():
+    return {**tts_cache.stats(), "limiter": tts_limiter.stats()}
 @app.websocket("/ws/stt")
 async def websocket_stt(websocket: WebSocket):
+    """
+    STT en streaming: el cliente envía PCM 16-bit mono a 16 kHz en mensajes binarios.
+    El VAD detecta el fin de cada enunciado y solo ese segmento de voz se transcribe,
+    en memoria. Un mensaje de texto "end" cierra el enunciado en curso. Cada conexión
+    usa su propia instancia de VAD (agresividad 0-3 configurable con ?vad=N).
+
+    Con resultados intermedios, mientras el conductor habla se re-decodifica el audio
+    acumulado cada INTERIM_INTERVAL_MS y se envían mensajes "partial" con la mejor
+    placa hasta el momento; "stable" indica que se repitió en las últimas hipótesis.
+    Al cerrarse el segmento se envía el mensaje "final".
+    """
     await websocket.accept()
-    buffer = b""
+    interim = INTERIM_RESULTS or websocket.query_params.get("interim") == "1"
+    try:
+        aggressiveness = int(websocket.query_params.get("vad", VAD_AGGRESSIVENESS))
+        segmenter = vad_pool.session(aggressiveness, SAMPLE_RATE, FRAME_DURATION_MS, PADDING_DURATION_MS)
+    except ValueError:
+        await websocket.close(code=1008, reason="Agresividad de VAD inválida (0-3)")
+        return
+    min_interim_bytes = SAMPLE_RATE * 2 * INTERIM_MIN_AUDIO_MS // 1000
+    partial_task = None
+    last_partial_at = 0.0
+    best_plate = None
+    recent_plates = []
+
+    def reset_partials():
+        nonlocal partial_task, best_plate, recent_plates
+        if partial_task and not partial_task.done():
+            partial_task.cancel()
+        partial_task = None
+        best_plate = None
+        recent_plates = []
+
+    async def send_partial(audio: bytes):
+        nonlocal best_plate, recent_plates
+        try:
+            hypothesis = await stt_limiter.run(transcribe_partial, pcm16_to_float32(audio))
+        except (OverloadedError, STTOverloadedError):
+            return
+        except Exception as e:
+            logging.error(f"Error en hipótesis intermedia: {e}")
+            return
+        plate = hypothesis["plate"]
+        if plate:
+            best_plate = plate
+        recent_plates = (recent_plates + [plate])[-INTERIM_STABLE_COUNT:]
+        stable = (plate is not None and len(recent_plates) == INTERIM_STABLE_COUNT
+                  and all(p == plate for p in recent_plates))
+        await websocket.send_json({
+            "type": "partial",
+            "plate": best_plate,
+            "raw_text": hypothesis["raw_text"],
+            "stable": stable
+        })
+
+    def maybe_schedule_partial():
+        nonlocal partial_task, last_partial_at
+        if not interim or not segmenter.in_speech:
+            return
+        if partial_task and not partial_task.done():
+            return
+        now = time.monotonic()
+        # Las hipótesis son opcionales: no compiten por cupo si STT está saturado
+        if (now - last_partial_at) * 1000 < INTERIM_INTERVAL_MS or stt_limiter.busy:
+            return
+        audio = segmenter.voiced_audio
+        if len(audio) < min_interim_bytes:
+            return
+        last_partial_at = now
+        partial_task = asyncio.create_task(send_partial(audio))
+
+    async def send_transcription(segment: bytes):
+        reset_partials()
+        try:
+            result = await stt_limiter.run(transcribe_optimized, pcm16_to_float32(segment))
+        except (OverloadedError, STTOverloadedError):
+            result = {"success": False, "plate": None, "message": "Servicio saturado"}
+        await websocket.send_json({"type": "final", **result})
+
     try:
         while True:
-            data = await websocket.receive_bytes()
-            buffer += data
-            if len(buffer) > 32000:
-                temp_file = f"temp_audio/{uuid.uuid4()}.wav"
-                # Escribir buffer como WAV (necesitarías implementar write_wave)
-                # write_wave(temp_file, buffer, SAMPLE_RATE)
-                result = transcribe_optimized(temp_file)
-                await websocket.send_json(result)
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                buffer = b""
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                for segment in segmenter.push(message["bytes"]):
+                    await send_transcription(segment)
+                maybe_schedule_partial()
+            elif message.get("text", "").strip().lower() == "end":
+                segment = segmenter.flush()
+                if segment:
+                    await send_transcription(segment)
     except WebSocketDisconnect:
         pass
     except Exception as e:
         logging.error(f"Error en WebSocket: {e}")
+    finally:
+        reset_partials()
+        segmenter.close()
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
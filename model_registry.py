@@ -0,0 +1,164 @@
+"""
+Registro de modelos con carga diferida o en segundo plano.
+
+Ningún modelo se carga al importar los servicios: cada uno se registra con su
+función de carga y, opcionalmente, una inferencia de calentamiento sobre
+audio/texto sintético. ``get(name)`` carga el modelo la primera vez que se
+necesita (o espera a la carga en segundo plano si ya empezó) y
+``start_background()`` carga y calienta todos los modelos de precarga en un
+hilo aparte, de modo que la API abre el puerto de inmediato y ``/health/ready``
+pasa a 200 solo cuando los modelos están listos.
+
+Estados: pending -> loading -> warming -> ready (o failed).
+
+Una carga fallida no es definitiva: se reintenta con espera exponencial
+(``retry_base`` segundos, duplicándose hasta ``retry_max``), tanto desde
+``get`` como desde el hilo de precarga, así un error transitorio no deja
+``/health/ready`` en 503 hasta reiniciar el servicio.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _ModelEntry:
+    __slots__ = ("name", "loader", "warmup", "preload", "state", "value", "error",
+                 "load_seconds", "warmup_seconds", "loaded", "lock", "failures", "retry_at")
+
+    def __init__(self, name: str, loader: Callable, warmup: Optional[Callable], preload: bool):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.preload = preload
+        self.state = "pending"
+        self.value = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.loaded = threading.Event()
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class ModelRegistry:
+    """Modelos con nombre, cargados una sola vez y con métricas de carga/calentamiento"""
+
+    def __init__(self, retry_base: float = 5.0, retry_max: float = 300.0):
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._background: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable, warmup: Optional[Callable] = None,
+                 preload: bool = True) -> None:
+        """preload=False: solo se carga cuando alguien lo pide (no cuenta para readiness)"""
+        self._entries[name] = _ModelEntry(name, loader, warmup, preload)
+
+    def get(self, name: str, timeout: Optional[float] = None):
+        """Modelo cargado; lo carga en este hilo si nadie lo ha empezado a cargar"""
+        entry = self._entries[name]
+        if entry.state == "failed" and time.monotonic() >= entry.retry_at:
+            self._schedule_retry(entry)
+        if not entry.loaded.is_set():
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if not entry.loaded.is_set():
+                        self._load(entry)
+                finally:
+                    entry.lock.release()
+            elif not entry.loaded.wait(timeout):
+                raise TimeoutError(f"Modelo {name} aún cargando")
+        if entry.state == "failed":
+            raise RuntimeError(f"Modelo {name} no disponible: {entry.error}")
+        return entry.value
+
+    def _schedule_retry(self, entry: _ModelEntry) -> None:
+        """Vuelve a dejar el modelo pendiente de carga (solo un hilo lo hace)"""
+        with entry.lock:
+            if entry.state == "failed" and time.monotonic() >= entry.retry_at:
+                logger.info(f"Reintentando carga de {entry.name} (intento {entry.failures + 1})")
+                entry.state = "pending"
+                entry.loaded.clear()
+
+    def _load(self, entry: _ModelEntry) -> None:
+        entry.state = "loading"
+        started = time.perf_counter()
+        try:
+            entry.value = entry.loader()
+        except Exception as e:
+            entry.failures += 1
+            delay = min(self.retry_max, self.retry_base * 2 ** (entry.failures - 1))
+            entry.retry_at = time.monotonic() + delay
+            entry.state = "failed"
+            entry.error = str(e)
+            logger.error(f"Error cargando modelo {entry.name}: {e} (reintento en {delay:.1f}s)")
+            entry.loaded.set()
+            return
+        entry.failures = 0
+        entry.error = None
+        entry.load_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Modelo {entry.name} cargado en {entry.load_seconds:.2f}s")
+        # A partir de aquí get() ya puede devolverlo (el calentamiento lo usa)
+        entry.loaded.set()
+
+        if entry.warmup is not None:
+            entry.state = "warming"
+            started = time.perf_counter()
+            try:
+                entry.warmup(entry.value)
+            except Exception as e:
+                # Un calentamiento fallido no invalida el modelo: solo se pierde la ventaja
+                logger.warning(f"Calentamiento de {entry.name} falló: {e}")
+            entry.warmup_seconds = round(time.perf_counter() - started, 3)
+            logger.info(f"Modelo {entry.name} calentado en {entry.warmup_seconds:.2f}s")
+        entry.state = "ready"
+
+    def start_background(self) -> None:
+        """Carga y calienta en un hilo todos los modelos con preload=True, reintentando los fallidos"""
+        if self._background is not None:
+            return
+
+        def load_all():
+            while True:
+                pending = [entry for entry in self._entries.values()
+                           if entry.preload and entry.state != "ready"]
+                for entry in pending:
+                    try:
+                        self.get(entry.name)
+                    except Exception:
+                        pass  # el estado failed ya quedó registrado
+                failed = [entry for entry in pending if entry.state == "failed"]
+                if not failed:
+                    return
+                time.sleep(max(0.0, min(entry.retry_at for entry in failed) - time.monotonic()))
+
+        self._background = threading.Thread(target=load_all, name="model-loader", daemon=True)
+        self._background.start()
+
+    def ready(self) -> bool:
+        """True si todos los modelos de precarga están cargados y calentados"""
+        return all(entry.state == "ready" for entry in self._entries.values() if entry.preload)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "state": entry.state,
+                "preload": entry.preload,
+                "load_seconds": entry.load_seconds,
+                "warmup_seconds": entry.warmup_seconds,
+                "error": entry.error,
+                "failures": entry.failures,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+registry = ModelRegistry(
+    retry_base=float(os.getenv("MODEL_RETRY_BASE_SECONDS", "5")),
+    retry_max=float(os.getenv("MODEL_RETRY_MAX_SECONDS", "300"))
+)
@@ -0,0 +1,156 @@
+"""
+Motores precompilados para convertir transcripciones de Whisper en placas.
+
+``PhraseTrie`` guarda todas las frases del vocabulario (letras, números y
+palabras a ignorar) palabra por palabra; se construye una sola vez y permite
+tokenizar el texto en una pasada con el match más largo en cada posición.
+
+``PlateGrammar`` compila las gramáticas de placa peruanas en un único patrón
+(alternativas con grupos nombrados dentro de un lookahead) y recorre el texto
+una sola vez devolviendo todos los candidatos con su patrón y posición.
+"""
+import re
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Carácter(es) producidos por una porción del texto: índices de palabra [start, end) y regla usada
+CharSpan = namedtuple("CharSpan", ["chars", "start", "end", "source", "rule"])
+
+# Marca de nodo terminal (ninguna palabra limpia puede ser la cadena vacía)
+_VALUE = ""
+SKIP = object()
+
+
+class PhraseTrie:
+    """Trie de frases palabra por palabra con búsqueda greedy del match más largo"""
+
+    def __init__(self):
+        self.root: Dict = {}
+        self.max_depth = 0
+
+    def add(self, phrase: str, value) -> None:
+        words = phrase.split()
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        node[_VALUE] = value
+        self.max_depth = max(self.max_depth, len(words))
+
+    def add_all(self, vocabulary: Dict[str, str]) -> None:
+        for phrase, value in vocabulary.items():
+            self.add(phrase, value)
+
+    def longest_match(self, words: List[str], start: int) -> Tuple[Optional[object], int]:
+        """(valor, cantidad de palabras) del match más largo que empieza en start"""
+        node = self.root
+        best_value, best_length = None, 0
+        for index in range(start, min(len(words), start + self.max_depth)):
+            node = node.get(words[index])
+            if node is None:
+                break
+            if _VALUE in node:
+                best_value, best_length = node[_VALUE], index - start + 1
+        return best_value, best_length
+
+
+def build_plate_trie(letters: Dict[str, str], num_words: Dict[str, str],
+                     skip_words: Iterable[str]) -> PhraseTrie:
+    """Trie único para LETTERS/NUM_WORDS/palabras del prompt (LETTERS gana ante claves repetidas)"""
+    trie = PhraseTrie()
+    trie.add_all(num_words)
+    trie.add_all(letters)
+    for word in skip_words:
+        trie.add(word, SKIP)
+    return trie
+
+
+def tokenize_plate_words(words: List[str], trie: PhraseTrie,
+                         correct: Optional[Callable[[str], Optional[str]]] = None
+                         ) -> Tuple[str, List[CharSpan]]:
+    """
+    Recorre las palabras una sola vez: frase del vocabulario más larga posible y, si no
+    hay, reglas para palabras sueltas (dígitos, letras cortas, letra+números, corrección).
+    Devuelve los caracteres extraídos y la procedencia de cada uno.
+    """
+    spans: List[CharSpan] = []
+    root = trie.root
+    n = len(words)
+    i = 0
+    while i < n:
+        word = words[i]
+        node = root.get(word)
+        if node is not None:
+            # Recorrido del trie en línea: es el camino caliente del tokenizador
+            value, length = node.get(_VALUE), 1
+            j = i + 1
+            while j < n:
+                node = node.get(words[j])
+                if node is None:
+                    break
+                j += 1
+                if _VALUE in node:
+                    value, length = node[_VALUE], j - i
+            if value is SKIP and length == 1:
+                i += 1
+                continue
+            if value is not None and value is not SKIP:
+                source = word if length == 1 else " ".join(words[i:i + length])
+                spans.append(CharSpan(value, i, i + length, source, "phrase"))
+                i += length
+                continue
+
+        if word.isdigit() and len(word) <= 4:
+            spans.append(CharSpan(word, i, i + 1, word, "digits"))
+        elif word.isalpha() and len(word) <= 3:
+            spans.append(CharSpan(word.upper(), i, i + 1, word, "letters"))
+        elif len(word) > 1 and word[0].isalpha() and word[1:].isdigit():
+            # Patrón letra+números (ej: "o2768")
+            letter_value = root.get(word[0], {}).get(_VALUE)
+            letter = letter_value if isinstance(letter_value, str) else word[0].upper()
+            spans.append(CharSpan(letter + word[1:], i, i + 1, word, "letter+digits"))
+        elif correct is not None:
+            corrected = correct(word)
+            if corrected:
+                spans.append(CharSpan(corrected, i, i + 1, word, "correction"))
+        i += 1
+
+    return "".join([span[0] for span in spans]), spans
+
+
+# Placa candidata encontrada en el texto: offsets [start, end) sobre el texto analizado
+PlateCandidate = namedtuple("PlateCandidate", ["plate", "pattern", "priority", "start", "end"])
+
+# Gramáticas de placa en orden de prioridad. "ABC123" y "ABC 123" (antes patrones
+# propios) ya están cubiertas por letters3_digits3.
+PLATE_PATTERNS = [
+    ("letters3_digits3", r"[A-Z]{3}[-\s]*\d{3}"),
+    ("letters2_digits4", r"[A-Z]{2}[-\s]*\d{4}"),
+    ("spelled", r"[A-Z]\s+[A-Z]\s+[A-Z]\s+\d\s+\d\s+\d"),
+    ("letter_digit_letter", r"[A-Z]\d[A-Z][-\s]*\d{3}"),
+]
+
+_SEPARATORS = {ord(c): None for c in "- \t\n\r\f\v"}
+
+
+class PlateGrammar:
+    """Todas las gramáticas en un patrón compilado; un solo recorrido del texto"""
+
+    def __init__(self, patterns=PLATE_PATTERNS):
+        self.names = [name for name, _ in patterns]
+        self._priority = {name: priority for priority, name in enumerate(self.names)}
+        # Las alternativas empiezan de forma excluyente (3 letras / 2 letras + dígito /
+        # letra + espacio / letra + dígito): en cada posición gana a lo sumo una, y
+        # el lookahead permite probar todas las posiciones sin consumir texto.
+        alternatives = "|".join(f"(?P<{name}>{regex})\\b" for name, regex in patterns)
+        self.pattern = re.compile(rf"\b(?=(?:{alternatives}))")
+
+    def candidates(self, text: str) -> List[PlateCandidate]:
+        """Candidatos ordenados por (prioridad del patrón, posición)"""
+        found = []
+        for match in self.pattern.finditer(text):
+            name = match.lastgroup
+            start, end = match.span(name)
+            found.append(PlateCandidate(match.group(name).translate(_SEPARATORS),
+                                        name, self._priority[name], start, end))
+        found.sort(key=lambda candidate: (candidate.priority, candidate.start))
+        return found
@@ -0,0 +1,162 @@
+"""
+Planificador de inferencia por lotes para Whisper.
+
+Las peticiones concurrentes se acumulan en micro-lotes (hasta ``max_batch_size``
+o ``max_wait_ms`` desde la primera en cola). Cada lote se concatena en un solo
+array y se decodifica con ``BatchedInferencePipeline`` pasando un
+``clip_timestamps`` por enunciado (offsets en muestras), de modo que cada clip
+ocupa una fila del lote. Los segmentos vuelven con tiempos en segundos y se
+devuelven a su petición según su posición temporal.
+"""
+import bisect
+import collections
+import inspect
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline
+
+from decoding_constraints import resolve_vocabulary
+
+logger = logging.getLogger(__name__)
+
+# Whisper procesa ventanas de 30 s: los enunciados más largos se parten en varios clips
+CHUNK_SECONDS = 30.0
+
+
+class _BatchRequest:
+    __slots__ = ("pcm", "options", "options_key", "future", "enqueued_at")
+
+    def __init__(self, pcm: np.ndarray, options: dict):
+        self.pcm = pcm
+        self.options = options
+        self.options_key = repr(sorted(options.items()))
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class WhisperBatchScheduler:
+    """Agrupa enunciados concurrentes y los decodifica en una sola llamada por lote"""
+
+    def __init__(self, model, max_batch_size: int = 8, max_wait_ms: float = 25.0,
+                 sample_rate: int = 16000):
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.sample_rate = sample_rate
+        self._accepted_options = set(inspect.signature(self.pipeline.transcribe).parameters)
+        self._queue: "queue.Queue[Optional[_BatchRequest]]" = queue.Queue()
+
+        # Métricas
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes = collections.Counter()
+        self._queue_waits = collections.deque(maxlen=1000)
+
+        self._thread = threading.Thread(target=self._loop, name="whisper-batcher", daemon=True)
+        self._thread.start()
+
+    def transcribe(self, pcm: np.ndarray, options: dict, timeout: Optional[float] = None):
+        """Encola el enunciado y espera su resultado: (lista de segmentos, info)"""
+        request = _BatchRequest(pcm, options)
+        self._queue.put(request)
+        return request.future.result(timeout=timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+    def _collect(self, first: _BatchRequest) -> List[_BatchRequest]:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            started = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.batch_sizes[len(batch)] += 1
+                self._queue_waits.extend(started - r.enqueued_at for r in batch)
+
+            # Solo se agrupan peticiones con los mismos parámetros de decodificación
+            groups = collections.OrderedDict()
+            for request in batch:
+                groups.setdefault(request.options_key, []).append(request)
+            for requests in groups.values():
+                try:
+                    self._run_group(requests)
+                except Exception as e:
+                    logger.error(f"Error en lote de Whisper ({len(requests)} peticiones): {e}")
+                    for request in requests:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+
+    def _run_group(self, requests: List[_BatchRequest]) -> None:
+        sr = self.sample_rate
+        chunk_samples = int(round(CHUNK_SECONDS * sr))
+        pieces, clips, span_starts = [], [], []
+        offset = 0
+        for request in requests:
+            length = len(request.pcm)
+            span_starts.append(offset / sr)
+            # BatchedInferencePipeline recorta el audio con clip_timestamps: van en muestras (int)
+            for start in range(0, length, chunk_samples):
+                end = min(length, start + chunk_samples)
+                clips.append({"start": offset + start, "end": offset + end})
+            pieces.append(request.pcm)
+            offset += length
+
+        results = [[] for _ in requests]
+        if not clips:
+            for request in requests:
+                request.future.set_result(([], None))
+            return
+
+        options = resolve_vocabulary(requests[0].options, self.pipeline.model)
+        options = {k: v for k, v in options.items() if k in self._accepted_options}
+        options.update(clip_timestamps=clips, vad_filter=False, batch_size=len(clips))
+        segments, info = self.pipeline.transcribe(np.concatenate(pieces).astype(np.float32), **options)
+
+        for segment in segments:
+            midpoint = (segment.start + segment.end) / 2
+            owner = max(0, bisect.bisect_right(span_starts, midpoint) - 1)
+            results[owner].append(segment)
+
+        for request, own_segments in zip(requests, results):
+            request.future.set_result((own_segments, info))
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits_ms = sorted(w * 1000 for w in self._queue_waits)
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "queue_wait_ms_avg": round(sum(waits_ms) / len(waits_ms), 2) if waits_ms else 0.0,
+                "queue_wait_ms_p95": round(waits_ms[int(0.95 * (len(waits_ms) - 1))], 2) if waits_ms else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
@@ -2,20 +2,36 @@ import re
 import os
 import subprocess
 import logging
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple, Union
 from pathlib import Path
 import time
+import threading
+import numpy as np
 from faster_whisper import WhisperModel
-import difflib
-
-logging.basicConfig(level=logging.WARNING)
+from utils import decode_audio, trim_to_voiced
+from stt_batching import WhisperBatchScheduler
+from stt_workers import STTProcessPool, STTOverloadedError
+from plate_parsing import PlateCandidate, PlateGrammar, build_plate_trie, tokenize_plate_words
+from fuzzy_match import FuzzyIndex
+from diagnostics import setup_logging, start_trace, trace_event, trace_fields
+from text_normalizer import correct_common_errors, filter_problematic_text
+from confirmation import Intent, IntentMatcher, average_logprob
+from decoding_constraints import VOCABULARY_OPTION, resolve_vocabulary
+from model_registry import registry
+
+setup_logging()
 logger = logging.getLogger(__name__)
-# Cargar modelo de Faster-Whisper
-try:
-    model = WhisperModel("medium", device="cpu", compute_type="int8")
-except Exception as e:
-    logger.error(f"No se pudo cargar el modelo: {e}")
-    raise
+# Modelo de Faster-Whisper: se carga a través de model_registry (diferido o en segundo plano)
+STT_MODEL_SIZE = os.getenv("STT_MODEL_SIZE", "medium")
+STT_COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")
+
+# Cascada para placas: primero un modelo pequeño, por run_transcription con el mismo modo de ejecución
+# (directo, lote propio o el worker que también lo carga); si la placa no es válida o la log-prob
+# media no alcanza el umbral, se vuelve a decodificar con el modelo principal
+STT_CASCADE_ENABLED = os.getenv("STT_CASCADE", "0") == "1"
+STT_CASCADE_MODEL_SIZE = os.getenv("STT_CASCADE_MODEL_SIZE", "base")
+STT_CASCADE_COMPUTE_TYPE = os.getenv("STT_CASCADE_COMPUTE_TYPE", "int8")
+STT_CASCADE_MIN_LOGPROB = float(os.getenv("STT_CASCADE_MIN_LOGPROB", "-0.4"))
 NUM_WORDS = {
     "cero": "0", "uno": "1", "una": "1", "dos": "2", "tres": "3",
     "cuatro": "4", "cinco": "5", "seis": "6", "siete": "7",
@@ -111,60 +127,338 @@ VALID_ZONES = {
     "A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", 
     "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z",
 }
+# Confirmaciones con log-prob media por debajo de este umbral se marcan como dudosas
+CONFIRMATION_MIN_LOGPROB = float(os.getenv("STT_CONFIRMATION_MIN_LOGPROB", "-0.5"))
+CONFIRMATION_MATCHER = IntentMatcher(AFFIRMATIVE_KEYWORDS, NEGATIVE_KEYWORDS, CONFIRMATION_MIN_LOGPROB)
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
+SAMPLE_RATE = 16000  # Whisper espera 16 kHz mono float32
+
+# Entrada aceptada por las funciones de transcripción: ruta, bytes/memoryview subidos o PCM ya decodificado
+AudioInput = Union[str, bytes, memoryview, np.ndarray]
+
+# Segmentos de placa con log-prob media por debajo de este valor se descartan
+PLATE_SEGMENT_MIN_LOGPROB = -0.5
+
+# Parámetros de decodificación para dictado de placas
+PLATE_DECODE_OPTIONS = dict(
+    language="es",
+
+    # MÁXIMO DETERMINISMO
+    beam_size=2,
+    best_of=1,
+    temperature=0.0,  # NO usar lista, solo valor único
+
+    # Umbrales más estrictos para mayor consistencia
+    compression_ratio_threshold=2.0,  #  estricto
+    log_prob_threshold=-0.6,  #  estricto
+    no_speech_threshold=0.4,  # estricto
+
+    # CONFIGURACIONES PARA MÁXIMA REPRODUCIBILIDAD
+    condition_on_previous_text=False,  # Sin contexto previo
+    word_timestamps=False,
+    prepend_punctuations="",  # Vacío
+    append_punctuations="",  # Vacío
+
+    # PROMPT
+    initial_prompt="Dictado de placa vehicular: letras y números separados.",
+
+    # CONFIGURACIONES ADICIONALES PARA DETERMINISMO
+    without_timestamps=True,  # Sin timestamps internos
+)
+
+# Parámetros de decodificación para respuestas cortas (confirmaciones)
+GENERAL_DECODE_OPTIONS = dict(
+    language="es",
+    beam_size=5,
+    best_of=5,
+    temperature=[0.0, 0.2, 0.4, 0.6, 0.8],
+    compression_ratio_threshold=2.4,
+    log_prob_threshold=-1.0,
+    no_speech_threshold=0.6,
+    condition_on_previous_text=False,
+    word_timestamps=True,
+    initial_prompt="Respuesta corta en español",
+)
+
+# Confirmaciones: "fast" decodifica greedy, sin timestamps de palabra y con pocos tokens,
+# y solo repite con GENERAL_DECODE_OPTIONS (beam search) si la confianza es baja; "full" (por defecto) usa siempre beam
+CONFIRMATION_DECODE_MODE = os.getenv("STT_CONFIRMATION_DECODE_MODE", "full")
+CONFIRMATION_ESCALATE_LOGPROB = float(os.getenv("STT_CONFIRMATION_ESCALATE_LOGPROB", "-0.6"))
+FAST_CONFIRMATION_DECODE_OPTIONS = dict(
+    GENERAL_DECODE_OPTIONS,
+    beam_size=1,
+    best_of=1,
+    temperature=0.0,
+    word_timestamps=False,
+    without_timestamps=True,
+    max_new_tokens=int(os.getenv("STT_CONFIRMATION_MAX_NEW_TOKENS", "10")),
+)
+
+# Decodificación de placas: "prompt" (prompt inicial + tabla de alias) o "constrained"
+# (salida restringida al vocabulario deletreado, greedy y con longitud máxima)
+PLATE_DECODE_MODE = os.getenv("STT_PLATE_DECODE_MODE", "prompt")
+PLATE_MAX_NEW_TOKENS = int(os.getenv("STT_PLATE_MAX_NEW_TOKENS", "32"))
+PLATE_HOTWORDS = ("a be ce de e efe ge hache i jota ka ele eme ene o pe cu erre ese te u uve "
+                  "doble uve equis ye zeta cero uno dos tres cuatro cinco seis siete ocho nueve")
+
+# "direct": cada petición decodifica sola; "batch": micro-lotes con BatchedInferencePipeline;
+# "process": pool de procesos con un modelo por worker
+STT_EXECUTION_MODE = os.getenv("STT_EXECUTION_MODE", "direct")
+STT_BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+STT_BATCH_WAIT_MS = float(os.getenv("STT_BATCH_WAIT_MS", "25"))
+STT_WORKERS = int(os.getenv("STT_WORKERS", "2"))
+STT_WORKER_THREADS = int(os.getenv("STT_WORKER_THREADS", "0")) or None  # 0 = núcleos / workers
+STT_MAX_PENDING = int(os.getenv("STT_MAX_PENDING", "0")) or None  # 0 = 4 por worker
+STT_PIN_CPUS = os.getenv("STT_PIN_CPUS", "0") == "1"
+# "0": el backend STT no se precarga al arrancar (se carga con la primera petición y no cuenta
+# para /health/ready), p. ej. en despliegues que solo sirven TTS
+STT_PRELOAD = os.getenv("STT_PRELOAD", "1") == "1"
+
+# Recorte de silencio con VAD antes de decodificar (el costo de Whisper crece con la duración)
+VAD_TRIM_ENABLED = os.getenv("VAD_TRIM_ENABLED", "1") == "1"
+VAD_TRIM_AGGRESSIVENESS = int(os.getenv("VAD_TRIM_AGGRESSIVENESS", "2"))
+VAD_TRIM_PADDING_MS = int(os.getenv("VAD_TRIM_PADDING_MS", "200"))
+
+_batch_scheduler = None
+_batch_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler() -> WhisperBatchScheduler:
+    """Planificador de micro-lotes; es dueño del único WhisperModel del proceso en modo batch"""
+    global _batch_scheduler
+    with _batch_scheduler_lock:
+        if _batch_scheduler is None:
+            _batch_scheduler = WhisperBatchScheduler(
+                _load_whisper(),
+                max_batch_size=STT_BATCH_SIZE,
+                max_wait_ms=STT_BATCH_WAIT_MS,
+                sample_rate=SAMPLE_RATE
+            )
+        return _batch_scheduler
+
+
+_fast_batch_scheduler = None
+
+
+def get_fast_batch_scheduler() -> WhisperBatchScheduler:
+    """Planificador de micro-lotes del modelo pequeño de la cascada"""
+    global _fast_batch_scheduler
+    with _batch_scheduler_lock:
+        if _fast_batch_scheduler is None:
+            _fast_batch_scheduler = WhisperBatchScheduler(
+                _load_fast_whisper(),
+                max_batch_size=STT_BATCH_SIZE,
+                max_wait_ms=STT_BATCH_WAIT_MS,
+                sample_rate=SAMPLE_RATE
+            )
+        return _fast_batch_scheduler
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> STTProcessPool:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = STTProcessPool(
+                model_size=STT_MODEL_SIZE,
+                compute_type=STT_COMPUTE_TYPE,
+                workers=STT_WORKERS,
+                cpu_threads=STT_WORKER_THREADS,
+                max_pending=STT_MAX_PENDING,
+                pin_cpus=STT_PIN_CPUS,
+                fast_model_size=STT_CASCADE_MODEL_SIZE if STT_CASCADE_ENABLED else None,
+                fast_compute_type=STT_CASCADE_COMPUTE_TYPE
+            )
+        return _process_pool
+
+
+def run_transcription(pcm: np.ndarray, options: dict, tier: str = "full"):
+    """Punto único de decodificación: directa, agrupada en micro-lotes o en un proceso worker.
+    tier="fast" usa el modelo pequeño de la cascada con el mismo modo de ejecución."""
+    if STT_EXECUTION_MODE == "process":
+        return registry.get(STT_BACKEND).transcribe(pcm, options, tier=tier)
+    backend = registry.get(STT_BACKEND if tier == "full" else STT_FAST_BACKEND)
+    if STT_EXECUTION_MODE == "batch":
+        return backend.transcribe(pcm, options)
+    segments, info = backend.transcribe(pcm, **resolve_vocabulary(options, backend))
+    return list(segments), info
+
+
+# Vocabulario restringido: solo viajan las palabras; cada proceso calcula suppress_tokens con su
+# modelo una vez (decoding_constraints.resolve_vocabulary)
+_PLATE_VOCABULARY = {word for phrase in list(LETTERS) + list(NUM_WORDS) for word in phrase.split()}
+_PLATE_VOCABULARY.update(PLATE_HOTWORDS.split())
+_PLATE_VOCABULARY.update("abcdefghijklmnopqrstuvwxyz")  # letras sueltas ("A B C 1 2 3")
+CONSTRAINED_PLATE_DECODE_OPTIONS = dict(
+    PLATE_DECODE_OPTIONS,
+    beam_size=1,
+    hotwords=PLATE_HOTWORDS,
+    max_new_tokens=PLATE_MAX_NEW_TOKENS,
+    **{VOCABULARY_OPTION: tuple(sorted(_PLATE_VOCABULARY))},
+)
+
+
+def get_plate_decode_options() -> dict:
+    """Opciones de decodificación de placas según STT_PLATE_DECODE_MODE"""
+    if PLATE_DECODE_MODE != "constrained":
+        return PLATE_DECODE_OPTIONS
+    return CONSTRAINED_PLATE_DECODE_OPTIONS
+
+
+def _load_whisper() -> WhisperModel:
+    return WhisperModel(STT_MODEL_SIZE, device="cpu", compute_type=STT_COMPUTE_TYPE)
+
+
+def _warmup_audio() -> np.ndarray:
+    """1 s de ruido suave para calentar los modelos"""
+    return (np.random.default_rng(0).standard_normal(SAMPLE_RATE) * 0.01).astype(np.float32)
+
+
+def _warmup_options() -> list:
+    """Opciones reales de placa y de confirmación"""
+    return [get_plate_decode_options(),
+            FAST_CONFIRMATION_DECODE_OPTIONS if CONFIRMATION_DECODE_MODE == "fast" else GENERAL_DECODE_OPTIONS]
+
+
+def _warm_backend(_backend) -> None:
+    pcm = _warmup_audio()
+    for options in _warmup_options():
+        run_transcription(pcm, options)
+
+
+def _warm_process_pool(pool: STTProcessPool) -> None:
+    pool.warm_up(_warmup_audio(), _warmup_options())
+
 
+# Un solo backend de decodificación por modo: solo "direct" tiene un WhisperModel suelto en la API;
+# en "batch" el modelo pertenece al planificador y en "process" vive en los workers
+STT_BACKENDS = {
+    "direct": ("whisper", _load_whisper, _warm_backend),
+    "batch": ("stt_batch_scheduler", get_batch_scheduler, _warm_backend),
+    "process": ("stt_process_pool", get_process_pool, _warm_process_pool),
+}
+STT_BACKEND = STT_BACKENDS[STT_EXECUTION_MODE][0]
+registry.register(*STT_BACKENDS[STT_EXECUTION_MODE], preload=STT_PRELOAD)
+
+
+def _load_fast_whisper() -> WhisperModel:
+    return WhisperModel(STT_CASCADE_MODEL_SIZE, device="cpu", compute_type=STT_CASCADE_COMPUTE_TYPE)
 
-def filter_problematic_text(text: str) -> str:
-    """Filtrar texto del modelo - versión mejorada para eliminar prompt"""
-    unwanted_patterns = [
-        r'TURESPUESTACORTAENESPAÑOL',
-        r'TU\s*RESPUESTA\s*CORTA\s*EN\s*ESPAÑOL',
-        r'RESPUESTA\s*CORTA\s*EN\s*ESPAÑOL',
-
-        # ELIMINAR COMPLETAMENTE EL PROMPT INICIAL Y VARIACIONES
-        r'usuario\s+dicta.*',
-        r'placa\s+vehicular.*',
-        r'transcribir\s+exactamente.*',
-        r'transcribir.*exactamente.*',
-        r'cada\s+carácter.*',
-        r'sin\s+interpretarlo.*',
-        r'como\s+palabras.*',
-        r'letras\s+y\s+números.*',
-
-        # PALABRAS SUELTAS DEL PROMPT SI APARECEN
-        r'\btranscribir\b',
-        r'\bexactamente\b',
-        r'\bcada\b',
-        r'\bcarácter\b',
-        r'\bdictado\b',
-        r'\binterpretarlo\b',
-        r'\bcomo\b',
-        r'\bpalabras\b',
-        r'\busuario\b',
-        r'\bvehicular\b',
-        r'\bperuana\b',
-    ]
 
-    cleaned = text
-    for pattern in unwanted_patterns:
-        cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE)
+def _warm_fast_tier(_backend) -> None:
+    run_transcription(_warmup_audio(), get_plate_decode_options(), tier="fast")
 
-    # Limpiar puntuación
-    cleaned = re.sub(r'[¡!¿?.,;:()"\'\[\]{}]', '', cleaned)
-    cleaned = re.sub(r'^[-\s]+|[-\s]+$', '', cleaned)
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
 
-    return cleaned
+# Nivel rápido de la cascada; en "process" el modelo pequeño se carga dentro de cada worker
+STT_FAST_BACKENDS = {
+    "direct": ("whisper_fast", _load_fast_whisper, _warm_fast_tier),
+    "batch": ("stt_batch_scheduler_fast", get_fast_batch_scheduler, _warm_fast_tier),
+}
+STT_FAST_BACKEND = STT_FAST_BACKENDS[STT_EXECUTION_MODE][0] if STT_EXECUTION_MODE in STT_FAST_BACKENDS else None
+if STT_FAST_BACKEND:
+    registry.register(*STT_FAST_BACKENDS[STT_EXECUTION_MODE], preload=STT_CASCADE_ENABLED and STT_PRELOAD)
+
+_cascade_stats = {
+    "fast": {"resolved": 0, "attempts": 0, "decode_seconds": 0.0},
+    "full": {"resolved": 0, "attempts": 0, "decode_seconds": 0.0},
+}
+_cascade_stats_lock = threading.Lock()
+
+
+def _record_tier(tier: str, seconds: float, resolved: bool) -> None:
+    with _cascade_stats_lock:
+        stats = _cascade_stats[tier]
+        stats["attempts"] += 1
+        stats["resolved"] += int(resolved)
+        stats["decode_seconds"] += seconds
+
+
+def plate_from_segments(segments: list) -> Tuple[str, Optional[str]]:
+    """Texto de los segmentos confiables y la placa extraída (None si el texto es muy corto)"""
+    text = ''.join(seg.text for seg in segments if seg.avg_logprob > PLATE_SEGMENT_MIN_LOGPROB).strip()
+    return text, (extract_plate(text) if len(text) >= 3 else None)
+
+
+def _cascade_accepts(segments: list) -> Optional[str]:
+    """Placa del nivel rápido si su confianza pasa el umbral y es válida; None para escalar"""
+    confidence = average_logprob(seg.avg_logprob for seg in segments)
+    if confidence is None or confidence < STT_CASCADE_MIN_LOGPROB:
+        return None
+    _, plate = plate_from_segments(segments)
+    return plate if is_valid_plate(plate) else None
+
+
+def decode_plate_audio(pcm: np.ndarray) -> Tuple[list, object, str, Optional[str]]:
+    """Segmentos de la placa dictada, el nivel que los resolvió ("fast" o "full") y la placa extraída"""
+    options = get_plate_decode_options()
+    if STT_CASCADE_ENABLED:
+        started = time.perf_counter()
+        segments, info = run_transcription(pcm, options, tier="fast")
+        plate = _cascade_accepts(segments)
+        _record_tier("fast", time.perf_counter() - started, plate is not None)
+        trace_event("cascade", tier="fast", accepted=plate is not None)
+        if plate is not None:
+            return segments, info, "fast", plate
+
+    started = time.perf_counter()
+    segments, info = run_transcription(pcm, options)
+    _, plate = plate_from_segments(segments)
+    _record_tier("full", time.perf_counter() - started, is_valid_plate(plate))
+    return segments, info, "full", plate
+
+
+_confirmation_stats = {"fast": 0, "escalated": 0}
+_confirmation_stats_lock = threading.Lock()
+
+
+def decode_confirmation(pcm: np.ndarray) -> Tuple[list, str]:
+    """Segmentos de una respuesta corta y la decodificación usada ("greedy" o "beam")"""
+    if CONFIRMATION_DECODE_MODE != "fast":
+        segments, _ = run_transcription(pcm, GENERAL_DECODE_OPTIONS)
+        return segments, "beam"
+
+    segments, _ = run_transcription(pcm, FAST_CONFIRMATION_DECODE_OPTIONS)
+    confidence = average_logprob(seg.avg_logprob for seg in segments)
+    escalate = confidence is None or confidence < CONFIRMATION_ESCALATE_LOGPROB
+    with _confirmation_stats_lock:
+        _confirmation_stats["escalated" if escalate else "fast"] += 1
+    trace_event("confirmation_decode", greedy_logprob=confidence, escalated=escalate)
+    if not escalate:
+        return segments, "greedy"
+    segments, _ = run_transcription(pcm, GENERAL_DECODE_OPTIONS)
+    return segments, "beam"
+
+
+def get_stats() -> dict:
+    return {
+        "execution_mode": STT_EXECUTION_MODE,
+        "plate_decode_mode": PLATE_DECODE_MODE,
+        "confirmation_decode_mode": CONFIRMATION_DECODE_MODE,
+        "confirmation_decodes": dict(_confirmation_stats),
+        "cascade": {
+            "enabled": STT_CASCADE_ENABLED,
+            "fast_model": STT_CASCADE_MODEL_SIZE,
+            "full_model": STT_MODEL_SIZE,
+            "tiers": {tier: dict(stats, decode_seconds=round(stats["decode_seconds"], 3))
+                      for tier, stats in _cascade_stats.items()},
+        },
+        "batching": _batch_scheduler.stats() if _batch_scheduler else None,
+        "batching_fast": _fast_batch_scheduler.stats() if _fast_batch_scheduler else None,
+        "process_pool": _process_pool.stats() if _process_pool else None,
+        "fuzzy_index": FUZZY_INDEX.stats(),
+    }
+
 
 def detect_confirmation(text: str) -> bool | None:
-    lowered = text.lower()
-    for word in AFFIRMATIVE_KEYWORDS:
-        if re.search(rf"\b{re.escape(word)}\b", lowered):
-            return True
-    for word in NEGATIVE_KEYWORDS:
-        if re.search(rf"\b{re.escape(word)}\b", lowered):
-            return False
-    return None
+    return CONFIRMATION_MATCHER.match(text).polarity
+
+
+def detect_intent(text: str, confidence: Optional[float] = None) -> Intent:
+    """Polaridad, frase y posición de la confirmación; marca low_confidence según la log-prob"""
+    return CONFIRMATION_MATCHER.match(text, confidence)
 def validate_audio_file(audio_path: str) -> Tuple[bool, str]:
     if not os.path.exists(audio_path):
         return False, "Archivo de audio no encontrado"
@@ -174,6 +468,35 @@ def validate_audio_file(audio_path: str) -> Tuple[bool, str]:
     if file_size > MAX_FILE_SIZE:
         return False, "Archivo de audio muy grande (máximo 25MB)"
     return True, ""
+def validate_audio_bytes(data: bytes) -> Tuple[bool, str]:
+    """Equivalente en memoria de validate_audio_file"""
+    if len(data) == 0:
+        return False, "El archivo de audio está vacío"
+    if len(data) > MAX_FILE_SIZE:
+        return False, "Archivo de audio muy grande (máximo 25MB)"
+    return True, ""
+def load_audio(audio: AudioInput) -> Tuple[Optional[np.ndarray], str]:
+    """Obtiene PCM float32 16 kHz mono listo para Whisper desde ruta, bytes o array"""
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.float32, copy=False), ""
+    if isinstance(audio, str):
+        is_valid, error_msg = validate_audio_file(audio)
+    else:
+        is_valid, error_msg = validate_audio_bytes(audio)
+    if not is_valid:
+        return None, error_msg
+    pcm = decode_audio(audio, SAMPLE_RATE)
+    if pcm is None or pcm.size == 0:
+        return None, "No se detectó voz clara en el audio"
+    return pcm, ""
+def trim_silence(pcm: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Deja solo el tramo con voz (más margen); devuelve el audio y los segundos recortados"""
+    if not VAD_TRIM_ENABLED:
+        return pcm, 0.0
+    trimmed = trim_to_voiced(pcm, SAMPLE_RATE, VAD_TRIM_AGGRESSIVENESS, VAD_TRIM_PADDING_MS)
+    trimmed_seconds = round((len(pcm) - len(trimmed)) / SAMPLE_RATE, 3)
+    trace_event("vad_trim", audio_seconds=round(len(pcm) / SAMPLE_RATE, 3), trimmed_seconds=trimmed_seconds)
+    return trimmed, trimmed_seconds
 def convert_to_opus_optimized(input_path: str) -> Optional[str]:
     output_path = f"/tmp/stt_tts_audio_{int(time.time())}.opus"
     try:
@@ -194,110 +517,38 @@ def clean_text(text: str) -> str:
     return re.sub(r'\s+', ' ', text)
 
 
+# Palabras del prompt que Whisper a veces repite y deben ignorarse
+SKIP_WORDS = ['transcribir', 'exactamente', 'cada', 'carácter', 'dictado',
+              'sin', 'interpretarlo', 'como', 'palabras', 'usuario',
+              'vehicular', 'peruana', 'letras', 'números']
+
+# Vocabulario completo precompilado una sola vez (frases de hasta 4 palabras)
+PLATE_TRIE = build_plate_trie(LETTERS, NUM_WORDS, SKIP_WORDS)
+
+# Índice difuso (fonético + n-gramas) para palabras fuera del vocabulario
+FUZZY_INDEX = FuzzyIndex({**NUM_WORDS, **LETTERS}, cutoff=0.7)
+
+# Gramáticas de placa compiladas en un solo patrón
+PLATE_GRAMMAR = PlateGrammar()
+
+
+def tokenize_plate_chars(text: str) -> Tuple[str, list]:
+    """Caracteres de la placa y su procedencia (CharSpan por frase/palabra reconocida)"""
+    return tokenize_plate_words(clean_text(text).split(), PLATE_TRIE, word_correction)
+
+
 def extract_chars(text: str) -> str:
-    words = clean_text(text).split()
-    print(f"Palabras después de limpiar: {words}")
-    chars = []
-    i = 0
-
-    while i < len(words):
-        word = words[i]
-        processed = False
-
-        # Saltar palabras del prompt
-        skip_words = ['transcribir', 'exactamente', 'cada', 'carácter', 'dictado',
-                      'sin', 'interpretarlo', 'como', 'palabras', 'usuario',
-                      'vehicular', 'peruana', 'letras', 'números']
-
-        if word.lower() in skip_words:
-            print(f"Saltando palabra del prompt: '{word}'")
-            i += 1
-            continue
-
-        # Buscar frases de 3 palabras
-        if i + 2 < len(words):
-            three_word = f"{word} {words[i + 1]} {words[i + 2]}"
-            if three_word in LETTERS:
-                chars.append(LETTERS[three_word])
-                i += 3
-                processed = True
-                continue
-            elif three_word in NUM_WORDS:
-                chars.append(NUM_WORDS[three_word])
-                i += 3
-                processed = True
-                continue
-
-        # Buscar frases de 2 palabras
-        if i + 1 < len(words) and not processed:
-            two_word = f"{word} {words[i + 1]}"
-            if two_word in LETTERS:
-                chars.append(LETTERS[two_word])
-                i += 2
-                processed = True
-                continue
-            elif two_word in NUM_WORDS:
-                chars.append(NUM_WORDS[two_word])
-                i += 2
-                processed = True
-                continue
-
-        # Procesar palabra individual
-        if not processed:
-            if word in LETTERS:
-                chars.append(LETTERS[word])
-                processed = True
-            elif word in NUM_WORDS:
-                chars.append(NUM_WORDS[word])
-                processed = True
-            elif word.isdigit() and len(word) <= 4:
-                chars.extend(word)
-                processed = True
-            elif word.isalpha() and len(word) <= 3:
-                chars.extend(list(word.upper()))
-                processed = True
-            elif len(word) > 1 and word[0].isalpha() and word[1:].isdigit():
-                # Patrón letra+números (ej: "o2768")
-                letter_part = word[0]
-                number_part = word[1:]
-
-                print(f"Detectado patrón letra+números: '{word}' → '{letter_part}' + '{number_part}'")
-
-                # Mapear la letra inicial
-                if letter_part in LETTERS:
-                    chars.append(LETTERS[letter_part])
-                    print(f"Letra mapeada: '{letter_part}' → '{LETTERS[letter_part]}'")
-                elif letter_part.isalpha():
-                    chars.append(letter_part.upper())
-                    print(f"Letra directa: '{letter_part}' → '{letter_part.upper()}'")
-
-                # Agregar cada dígito del número
-                for digit in number_part:
-                    chars.append(digit)
-                    print(f"Dígito agregado: '{digit}'")
-
-                processed = True
-            else:
-                # Intentar corrección como último recurso
-                corrected = word_correction(word)
-                if corrected:
-                    chars.append(corrected)
-                    processed = True
-                else:
-                    print(f"Palabra no reconocida: '{word}'")
-
-        i += 1
-
-    result = ''.join(chars)
-    print(f"Caracteres extraídos: {result}")
+    result, spans = tokenize_plate_chars(text)
+    trace_event("extract_chars", chars=result,
+                spans=lambda: [(span.source, span.chars, span.rule) for span in spans])
 
     # Validaciones finales
     if len(result) != 6:
-        print(f"Resultado longitud inválida ({len(result)} chars): {result} - RECHAZADO")
+        trace_event("extract_chars.rejected", reason="length", length=len(result))
         return ""
 
     if not result.isalnum():
-        print(f"Resultado no alfanumérico: {result} - RECHAZADO")
+        trace_event("extract_chars.rejected", reason="not_alnum")
         return ""
 
     return result
@@ -319,88 +570,51 @@ def is_suspicious_plate(plate: str) -> bool:
     return plate.upper() in suspicious_patterns
 
 
+def plate_candidates(text: str) -> List[PlateCandidate]:
+    """Todas las placas que cumplen alguna gramática, ordenadas por (prioridad, posición)"""
+    return PLATE_GRAMMAR.candidates(text.upper())
+
+
 def extract_plate(text: str) -> Optional[str]:
     text = text.upper().strip()
-    print(f"[DEBUG extract_plate] Input text: '{text}'")
-
-    patterns = [
-        r'\b([A-Z]{3})[-\s]*(\d{3})\b',
-        r'\b([A-Z]{2})[-\s]*(\d{4})\b',
-        r'\b([A-Z]{3})(\d{3})\b',
-        r'\b([A-Z]{3})\s+(\d{3})\b',
-        r'\b([A-Z])\s+([A-Z])\s+([A-Z])\s+(\d)\s+(\d)\s+(\d)\b',
-        r'\b([A-Z]\d[A-Z])[-\s]*(\d{3})\b'
-    ]
+    trace_event("extract_plate", text=text)
 
-    for i, pattern in enumerate(patterns):
-        matches = re.findall(pattern, text)
-        print(f"[DEBUG extract_plate] Pattern {i + 1}: {pattern} → Matches: {matches}")
-
-        for match in matches:
-            if len(match) == 2:
-                letters, numbers = match
-                full_plate = f"{letters}{numbers}"
-            elif len(match) == 6:
-                letters = ''.join(match[:3])
-                numbers = ''.join(match[3:])
-                full_plate = f"{letters}{numbers}"
-            else:
-                continue
-
-            print(f"[DEBUG extract_plate] Processing: letters='{letters}', numbers='{numbers}'")
-
-            # CORRECCIÓN: Pasar la placa completa, no letters y numbers por separado
-            if (letters[0] in VALID_ZONES and not is_suspicious_plate(full_plate)):
-                print(f"[DEBUG extract_plate] REGEX MATCH SUCCESS: '{full_plate}'")
-                return full_plate
-            else:
-                print(f"[DEBUG extract_plate] REGEX MATCH FAILED VALIDATION")
+    for candidate in PLATE_GRAMMAR.candidates(text):
+        full_plate = candidate.plate
+        if full_plate[0] in VALID_ZONES and not is_suspicious_plate(full_plate):
+            trace_event("extract_plate.match", plate=full_plate, pattern=candidate.pattern,
+                        start=candidate.start, end=candidate.end)
+            return full_plate
+        trace_event("extract_plate.rejected", plate=full_plate, pattern=candidate.pattern)
 
     # Si no hay match en regex, usar extract_chars
-    print(f"[DEBUG extract_plate] No regex matches, trying extract_chars...")
     chars = extract_chars(text)
 
     if len(chars) == 6:
-        print(f"[DEBUG extract_plate] extract_chars result: '{chars}'")
-
         is_alphanumeric = chars.isalnum()
         has_letter = any(c.isalpha() for c in chars)
         has_number = any(c.isdigit() for c in chars)
         valid_first_zone = chars[0] in VALID_ZONES
+        suspicious = is_suspicious_plate(chars)
+        trace_event("extract_plate.chars", plate=chars, alphanumeric=is_alphanumeric,
+                    has_letter=has_letter, has_number=has_number,
+                    valid_first_zone=valid_first_zone, suspicious=suspicious)
 
-        print(f"[DEBUG extract_plate] Validations:")
-        print(f"  - Length: {len(chars)} == 6: {len(chars) == 6}")
-        print(f"  - Alphanumeric: {is_alphanumeric}")
-        print(f"  - Has letter: {has_letter}")
-        print(f"  - Has number: {has_number}")
-        print(f"  - Valid first zone '{chars[0]}': {valid_first_zone}")
-
-        if is_alphanumeric and has_letter and has_number and valid_first_zone:
-            if not is_suspicious_plate(chars):  # CORRECTO: 1 parámetro
-                print(f"[DEBUG extract_plate] EXTRACT_CHARS SUCCESS: '{chars}'")
-                return chars
-            else:
-                print(f"[DEBUG extract_plate] EXTRACT_CHARS FAILED - suspicious plate: '{chars}'")
-        else:
-            print(f"[DEBUG extract_plate] EXTRACT_CHARS FAILED - validation failed")
-    else:
-        print(f"[DEBUG extract_plate] EXTRACT_CHARS FAILED - wrong length: {len(chars)} (expected 6)")
+        if is_alphanumeric and has_letter and has_number and valid_first_zone and not suspicious:
+            return chars
 
-    print(f"[DEBUG extract_plate] FINAL RESULT: None")
+    trace_event("extract_plate.none")
     return None
 
 
 def is_valid_plate(plate: Optional[str]) -> bool:
     """Validación simple - cualquier combinación alfanumérica de 6 caracteres"""
-    print(f"[DEBUG is_valid_plate] Input: '{plate}'")
-
     if not plate:
-        print(f"[DEBUG is_valid_plate] FAILED - plate is None/empty")
+        trace_event("is_valid_plate", plate=plate, result=False)
         return False
 
     try:
         clean_plate = plate.replace('-', '').upper()
-        print(f"[DEBUG is_valid_plate] Clean plate: '{clean_plate}'")
 
         # VALIDACIÓN SIMPLE
         is_correct_length = len(clean_plate) == 6
@@ -409,144 +623,120 @@ def is_valid_plate(plate: Optional[str]) -> bool:
         has_number = any(c.isdigit() for c in clean_plate)
         valid_first_zone = clean_plate[0] in VALID_ZONES if clean_plate else False
 
-        print(f"[DEBUG is_valid_plate] Validations:")
-        print(f"  - Length == 6: {is_correct_length}")
-        print(f"  - Alphanumeric: {is_alphanumeric}")
-        print(f"  - Has letter: {has_letter}")
-        print(f"  - Has number: {has_number}")
-        print(f"  - Valid zone: {valid_first_zone}")
-
         result = (is_correct_length and is_alphanumeric and
                   has_letter and has_number and valid_first_zone)
 
-        print(f"[DEBUG is_valid_plate] RESULT: {result}")
+        trace_event("is_valid_plate", plate=clean_plate, length_ok=is_correct_length,
+                    alphanumeric=is_alphanumeric, has_letter=has_letter,
+                    has_number=has_number, valid_first_zone=valid_first_zone, result=result)
         return result
 
     except Exception as e:
-        print(f"[DEBUG is_valid_plate] EXCEPTION: {e}")
+        logger.warning("Error validando placa %r: %s", plate, e)
         return False
 
-def transcribe_optimized(audio_path: str) -> dict:
+def transcribe_optimized(audio: AudioInput, trace: bool = False) -> dict:
+    """Placa dictada en el audio; con trace=True la respuesta incluye la traza de diagnóstico"""
+    with start_trace("transcribe_optimized", enabled=trace) as request_trace:
+        result = _transcribe_optimized(audio)
+    if trace:
+        result["trace"] = request_trace.to_dict()
+    return result
+
+
+def _transcribe_optimized(audio: AudioInput) -> dict:
     start_time = time.time()
-    opus_path = None
     try:
-        is_valid, error_msg = validate_audio_file(audio_path)
-        if not is_valid:
-            return {"success": False, "plate": None, "message": error_msg, "processing_time": 0}
-        opus_path = convert_to_opus_optimized(audio_path)
-        if not opus_path or not os.path.exists(opus_path):
-            return {"success": False, "plate": None,
-                   "message": "No se detectó voz clara en el audio",
-                   "processing_time": time.time() - start_time}
-
-        segments, info = model.transcribe(
-            opus_path,
-            language="es",
-
-            # MÁXIMO DETERMINISMO
-            beam_size=2,
-            best_of=1,
-            temperature=0.0,  # NO usar lista, solo valor único
-
-            # Umbrales más estrictos para mayor consistencia
-            compression_ratio_threshold=2.0,  #  estricto
-            log_prob_threshold=-0.6,  #  estricto
-            no_speech_threshold=0.4,  # estricto
-
-            # CONFIGURACIONES PARA MÁXIMA REPRODUCIBILIDAD
-            condition_on_previous_text=False,  # Sin contexto previo
-            word_timestamps=False,
-            prepend_punctuations="",  # Vacío
-            append_punctuations="",  # Vacío
-
-            # PROMPT
-            initial_prompt="Dictado de placa vehicular: letras y números separados.",
-
-            # CONFIGURACIONES ADICIONALES PARA DETERMINISMO
-            without_timestamps=True,  # Sin timestamps internos
-        )
+        pcm, error_msg = load_audio(audio)
+        if pcm is None:
+            return {"success": False, "plate": None, "message": error_msg,
+                    "processing_time": time.time() - start_time}
+
+        audio_seconds = round(len(pcm) / SAMPLE_RATE, 3)
+        pcm, trimmed_seconds = trim_silence(pcm)
+        segments, info, model_tier, plate = decode_plate_audio(pcm)
 
         text_segments = []
         segment_logprobs = []
 
         for seg in segments:
             # Filtro más estricto de confianza
-            if seg.avg_logprob > -0.5:  # Más estricto que -0.9
+            if seg.avg_logprob > PLATE_SEGMENT_MIN_LOGPROB:
                 text_segments.append(seg.text)
                 segment_logprobs.append(seg.avg_logprob)
 
         raw_text = ''.join(text_segments).strip()
 
-        # LOGGING CORREGIDO - SIN DIVISION BY ZERO
-        logger.info(f"Raw Whisper output: '{raw_text}'")
-        logger.info(f"Language detection confidence: {info.language_probability:.3f}")
-        logger.info(f"Segments processed: {len(text_segments)}")
-        if segment_logprobs:
-            avg_logprob = sum(segment_logprobs) / len(segment_logprobs)
-            logger.info(f"Average log probability: {avg_logprob:.3f}")
-        else:
-            logger.info(f"Average log probability: N/A (no segments)")
+        trace_fields(
+            raw_text=raw_text,
+            language_probability=round(info.language_probability, 3) if info else None,
+            segments=len(text_segments),
+            avg_logprob=(round(sum(segment_logprobs) / len(segment_logprobs), 3)
+                         if segment_logprobs else None),
+            audio_seconds=audio_seconds,
+            trimmed_seconds=trimmed_seconds,
+            model_tier=model_tier,
+        )
 
         if not raw_text or len(raw_text) < 3:
             return {"success": False, "plate": None,
                     "message": "No se detectó voz clara en el audio",
                     "processing_time": time.time() - start_time}
 
-        plate = extract_plate(raw_text)
-
         if is_valid_plate(plate):
             if is_valid_plate(plate):
                 return {"success": True, "plate": plate,
                         "message": f"Placa detectada: {plate}",
                         "raw_text": raw_text,
                         "confidences": segment_logprobs,
+                        "audio_seconds": audio_seconds,
+                        "trimmed_seconds": trimmed_seconds,
+                        "model_tier": model_tier,
                         "processing_time": time.time() - start_time}
         else:
             return {"success": False, "plate": None,
                     "message": "No pude determinar la matrícula",
                     "raw_text": raw_text,
                     "confidences": segment_logprobs,
+                    "audio_seconds": audio_seconds,
+                    "trimmed_seconds": trimmed_seconds,
+                    "model_tier": model_tier,
                     "processing_time": time.time() - start_time}
 
 
+    except STTOverloadedError:
+        # Se propaga para que la API responda 503 en lugar de un error técnico
+        raise
     except Exception as e:
         logger.error(f"Error en transcripción: {e}")
         return {"success": False, "plate": None,
                 "message": "Error técnico en el procesamiento",
                 "processing_time": time.time() - start_time}
-    finally:
-        if opus_path and os.path.exists(opus_path):
-            try:
-                os.remove(opus_path)
-            except Exception:
-                pass
-
-def transcribe_general(audio_path: str) -> dict:
+
+def transcribe_general(audio: AudioInput, trace: bool = False) -> dict:
+    """Confirmación (sí/no) del audio; con trace=True la respuesta incluye la traza de diagnóstico"""
+    with start_trace("transcribe_general", enabled=trace) as request_trace:
+        result = _transcribe_general(audio)
+    if trace:
+        result["trace"] = request_trace.to_dict()
+    return result
+
+
+def _transcribe_general(audio: AudioInput) -> dict:
     start_time = time.time()
-    opus_path = None
     try:
-        is_valid, error_msg = validate_audio_file(audio_path)
-        if not is_valid:
+        pcm, error_msg = load_audio(audio)
+        if pcm is None:
             return {"success": False, "confirmation": None, "message": error_msg}
-        opus_path = convert_to_opus_optimized(audio_path)
-        if not opus_path or not os.path.exists(opus_path):
-            return {"success": False, "confirmation": None,
-                    "message": "No se detectó voz clara en el audio"}
-        segments, _ = model.transcribe(opus_path, 
-        language="es",
-        beam_size=5,
-        best_of=5,
-        temperature=[0.0, 0.2, 0.4, 0.6, 0.8],
-        compression_ratio_threshold=2.4,
-        log_prob_threshold=-1.0,
-        no_speech_threshold=0.6,
-        condition_on_previous_text=False, 
-        word_timestamps=True,
-        initial_prompt="Respuesta corta en español")
+        audio_seconds = round(len(pcm) / SAMPLE_RATE, 3)
+        pcm, trimmed_seconds = trim_silence(pcm)
+        segments, decode = decode_confirmation(pcm)
         text_segments = []
+        segment_logprobs = []
         for seg in segments:
             if seg.avg_logprob > -0.8:
                text_segments.append(seg.text)
+               segment_logprobs.append(seg.avg_logprob)
         raw_text = ''.join(text_segments).strip()
         raw_text = filter_problematic_text(raw_text)
         if not raw_text or len(raw_text) < 1:
@@ -556,11 +746,10 @@ def transcribe_general(audio_path: str) -> dict:
             "message": "No se detectó voz clara en el audio",
             "raw": raw_text
           }
-        print(f" raw_text: {raw_text}")
         corrected_text = correct_common_errors(raw_text)
-        print(f" corrected_text: {corrected_text}")
         validated_text = validate_first_character(corrected_text)
-        print(f" validated_text: {validated_text}")
+        trace_fields(raw_text=raw_text, corrected_text=corrected_text, validated_text=validated_text,
+                     audio_seconds=audio_seconds, trimmed_seconds=trimmed_seconds)
         if validated_text is None:
            return {
             "success": False,
@@ -570,27 +759,37 @@ def transcribe_general(audio_path: str) -> dict:
             "corrected": corrected_text
            }
         cleaned = re.sub(r'\W+', '', validated_text)
-        print(f" validated_text2: {cleaned}")
+        trace_event("cleaned", text=cleaned)
         confirmation = detect_confirmation_enhanced(cleaned)
+        intent = detect_intent(raw_text, average_logprob(segment_logprobs))
+        trace_event("intent", **intent._asdict())
         return {
         "success": True,
         "raw": cleaned,
         "confirmation": confirmation,
+        "intent": intent._asdict(),
+        "decode": decode,
+        "audio_seconds": audio_seconds,
+        "trimmed_seconds": trimmed_seconds,
         }
+    except STTOverloadedError:
+        # Se propaga para que la API responda 503 en lugar de un error técnico
+        raise
     except Exception as e:
         logger.error(f"Error en transcripción: {e}")
         return {
             "success": False, "confirmation": None,
             "message": "Error técnico en el procesamiento",
         }
-    finally:
-        if opus_path and os.path.exists(opus_path):
-            try:
-                os.remove(opus_path)
-            except Exception:
-                pass
-def transcribe(audio_path: str) -> dict:
-    result = transcribe_optimized(audio_path)
+def transcribe_partial(pcm: np.ndarray) -> dict:
+    """Hipótesis intermedia para streaming: texto y mejor placa sobre el audio parcial"""
+    segments, _ = run_transcription(pcm, get_plate_decode_options())
+    raw_text = ''.join(seg.text for seg in segments).strip()
+    plate = extract_plate(raw_text) if len(raw_text) >= 3 else None
+    return {"raw_text": raw_text, "plate": plate}
+
+def transcribe(audio: AudioInput) -> dict:
+    result = transcribe_optimized(audio)
     if result["success"]:
         return {"text": result.get("raw_text", ""), "message": result["plate"]}
     else:
@@ -603,86 +802,7 @@ def word_correction(word: str) -> Optional[str]:
             return LETTERS[corrected_word]
         elif corrected_word in NUM_WORDS:
             return NUM_WORDS[corrected_word]
-    all_words = list(LETTERS.keys()) + list(NUM_WORDS.keys())
-    matches = difflib.get_close_matches(word, all_words, n=1, cutoff=0.7)
-    if matches:
-        best_match = matches[0]
-        if best_match in LETTERS:
-            return LETTERS[best_match]
-        elif best_match in NUM_WORDS:
-            return NUM_WORDS[best_match]
-    return None
-def correct_common_errors(text):
-    numbers_to_digits = {
-        'cero': '0', 'zero': '0',
-        'uno': '1', 'una': '1',
-        'dos': '2', 'dose': '2',
-        'tres': '3', 'tree': '3',
-        'cuatro': '4', 'quatro': '4',
-        'cinco': '5', 'zinco': '5',
-        'seis': '6', 'ses': '6',
-        'siete': '7', 'siebe': '7',
-        'ocho': '8', 'hoco': '8',
-        'nueve': '9', 'nuebe': '9',
-        'diez': '10', 'dies': '10',
-        'once': '11', 'onze': '11',
-        'doce': '12', 'doze': '12',
-        'trece': '13', 'treze': '13',
-        'catorce': '14', 'quatorze': '14',
-        'quince': '15', 'quinze': '15',
-        'dieciséis': '16', 'dieciseis': '16',
-        'diecisiete': '17', 'diecisiebe': '17',
-        'dieciocho': '18', 'diecioco': '18',
-        'diecinueve': '19', 'diecinuebe': '19',
-        'veinte': '20', 'beinte': '20',
-    }
-    
-    corrections_e = {
-        'p': 'e', 'P': 'E',
-        'be': 'e', 'pe': 'e', 'se': 'e', 'te': 'e',
-        'esé': 'e', 'ese': 'e', 'ete': 'e', 'erre': 'e',
-        'he': 'e', 'ye': 'e', 'de': 'e', 'le': 'e',
-        'me': 'e', 'ne': 'e', 're': 'e', 've': 'e',
-        'ce': 'e', 'ge': 'e', 'je': 'e', 'ke': 'e',
-        'que': 'e', 'qe': 'e', 'eh': 'e', 'ay': 'e',
-        'ei': 'e', 'ie': 'e', 'ae': 'e', 'ea': 'e'
-    }
-    
-    corrections_s = {
-        'es': 's', 'se': 's', 'ze': 's', 'ce': 's',
-        'ps': 's', 'hs': 's', 'ss': 's', 'sz': 's',
-        'as': 's', 'is': 's', 'os': 's', 'us': 's',
-        'eso': 's', 'esa': 's', 'esi': 's', 'esu': 's',
-        'si': 's', 'sy': 's', 'ts': 's', 'xs': 's',
-        'cs': 's', 'ds': 's', 'fs': 's', 'gs': 's'
-    }
-    
-    corrections_t = {
-        'te': 't', 'et': 't', 'th': 't', 'ht': 't',
-        'pt': 't', 'tt': 't', 'dt': 't', 'ct': 't',
-        'at': 't', 'it': 't', 'ot': 't', 'ut': 't',
-        'to': 't', 'ta': 't', 'ti': 't', 'tu': 't',
-        'ty': 't', 'tr': 't', 'st': 't', 'xt': 't',
-        'ft': 't', 'gt': 't', 'kt': 't', 'lt': 't',
-        'mt': 't', 'nt': 't', 'rt': 't', 'wt': 't',
-        'ta': 't'
-    }
-    
-    corrected = text.lower().strip()
-    
-    for word_num, digit in numbers_to_digits.items():
-        corrected = re.sub(r'\b' + word_num + r'\b', digit, corrected)
-    words = corrected.split()
-    if words:
-        first_word = words[0]
-        if first_word in corrections_e:
-            words[0] = corrections_e[first_word]
-        elif first_word in corrections_s:
-            words[0] = corrections_s[first_word]
-        elif first_word in corrections_t:
-            words[0] = corrections_t[first_word]
-    
-    return ' '.join(words) if words else corrected
+    return FUZZY_INDEX.lookup(word)
 def validate_first_character(text):
     if not text:
         return None
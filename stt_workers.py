@@ -0,0 +1,206 @@
+"""
+Pool de procesos para STT.
+
+Cada proceso worker carga su propio WhisperModel una sola vez (con
+``cpu_threads``/``num_workers`` fijos y, opcionalmente, afinidad de CPU) y
+atiende trabajos de transcripción. El proceso de la API solo encola: el
+número de trabajos pendientes está acotado y, si se llena, ``transcribe``
+falla rápido con ``STTOverloadedError`` en lugar de acumular latencia.
+
+``warm_up`` envía un trabajo de calentamiento por worker (una barrera entre
+procesos asegura que cada uno reciba exactamente uno), así ninguna petición
+real paga la carga del modelo. Si un worker muere, el executor queda roto
+(``BrokenProcessPool``): se crea uno nuevo y se vuelve a calentar en segundo
+plano.
+
+Con la cascada de placas activa cada worker carga además el modelo pequeño y
+los trabajos indican el nivel ("fast" o "full") con el que decodificar.
+
+Este módulo no importa stt_service para que los workers (arrancados con
+"spawn") no carguen el modelo del proceso principal.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+import numpy as np
+
+from decoding_constraints import resolve_vocabulary
+
+logger = logging.getLogger(__name__)
+
+
+class STTOverloadedError(RuntimeError):
+    """La cola de trabajos STT está llena"""
+
+
+# Estado propio de cada proceso worker
+_worker_models = {}
+_worker_barrier = None
+
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int, num_workers: int,
+                 slots, barrier, pin_cpus: bool, fast_model_size: Optional[str],
+                 fast_compute_type: str) -> None:
+    global _worker_barrier
+    _worker_barrier = barrier
+    slot = slots.get()
+    if pin_cpus and hasattr(os, "sched_setaffinity"):
+        cores = set(range(slot * cpu_threads, (slot + 1) * cpu_threads)) & os.sched_getaffinity(0)
+        if cores:
+            os.sched_setaffinity(0, cores)
+
+    from faster_whisper import WhisperModel
+    _worker_models["full"] = WhisperModel(
+        model_size,
+        device="cpu",
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=num_workers
+    )
+    if fast_model_size:
+        _worker_models["fast"] = WhisperModel(
+            fast_model_size,
+            device="cpu",
+            compute_type=fast_compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers
+        )
+    logging.getLogger(__name__).info(f"Worker STT {slot} listo (pid {os.getpid()})")
+
+
+def _transcribe_in_worker(pcm: np.ndarray, options: dict, tier: str = "full"):
+    model = _worker_models[tier]
+    segments, info = model.transcribe(pcm, **resolve_vocabulary(options, model))
+    return list(segments), info
+
+
+def _warm_up_worker(pcm: np.ndarray, options_list: List[dict], timeout: float) -> int:
+    # También deja calculado el vocabulario restringido de este worker
+    for model in _worker_models.values():
+        for options in options_list:
+            list(model.transcribe(pcm, **resolve_vocabulary(options, model))[0])
+    # Ocupado hasta que todos terminen: ningún worker toma dos trabajos de calentamiento
+    _worker_barrier.wait(timeout)
+    return os.getpid()
+
+
+class STTProcessPool:
+    """N procesos con un WhisperModel cada uno y una cola de trabajos con contrapresión"""
+
+    def __init__(self, model_size: str = "medium", compute_type: str = "int8",
+                 workers: int = 2, cpu_threads: Optional[int] = None, num_workers: int = 1,
+                 max_pending: Optional[int] = None, submit_timeout: float = 5.0,
+                 pin_cpus: bool = False, fast_model_size: Optional[str] = None,
+                 fast_compute_type: str = "int8"):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.fast_model_size = fast_model_size
+        self.fast_compute_type = fast_compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+        self.num_workers = num_workers
+        self.max_pending = max_pending or workers * 4
+        self.submit_timeout = submit_timeout
+        self.pin_cpus = pin_cpus
+
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._warm_up_job = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        ctx = multiprocessing.get_context("spawn")
+        slots = ctx.Queue()
+        for slot in range(self.workers):
+            slots.put(slot)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.model_size, self.compute_type, self.cpu_threads, self.num_workers,
+                      slots, ctx.Barrier(self.workers), self.pin_cpus,
+                      self.fast_model_size, self.fast_compute_type)
+        )
+
+    def warm_up(self, pcm: np.ndarray, options_list: List[dict], timeout: float = 600.0) -> None:
+        """Un trabajo por worker: arranca los N procesos, carga sus modelos y los calienta"""
+        self._warm_up_job = (pcm, options_list, timeout)
+        executor = self._executor
+        futures = [executor.submit(_warm_up_worker, pcm, options_list, timeout)
+                   for _ in range(self.workers)]
+        pids = [future.result(timeout=timeout) for future in futures]
+        logger.info(f"Workers STT calentados: {sorted(pids)}")
+
+    def _recover(self, broken: ProcessPoolExecutor) -> None:
+        """Reemplaza el executor roto (solo el primero que lo detecta) y lo recalienta aparte"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor()
+            self.restarts += 1
+        logger.error("Pool de procesos STT roto (un worker terminó); executor recreado")
+        broken.shutdown(wait=False, cancel_futures=True)
+        if self._warm_up_job is not None:
+            threading.Thread(target=self._warm_up_safely, name="stt-pool-warmup", daemon=True).start()
+
+    def _warm_up_safely(self) -> None:
+        try:
+            self.warm_up(*self._warm_up_job)
+        except Exception as e:
+            logger.error(f"Calentamiento del pool STT falló: {e}")
+
+    def _on_done(self, _future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._pending.release()
+
+    def transcribe(self, pcm: np.ndarray, options: dict, timeout: Optional[float] = None,
+                   tier: str = "full"):
+        """Envía el trabajo a un worker y espera (lista de segmentos, info); tier elige el modelo"""
+        if not self._pending.acquire(timeout=self.submit_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise STTOverloadedError("Cola de transcripción llena")
+        with self._lock:
+            self.in_flight += 1
+            executor = self._executor
+        try:
+            future = executor.submit(_transcribe_in_worker, pcm, options, tier)
+        except Exception as e:
+            with self._lock:
+                self.in_flight -= 1
+            self._pending.release()
+            if isinstance(e, BrokenProcessPool):
+                self._recover(executor)
+            raise
+        future.add_done_callback(self._on_done)
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            self._recover(executor)
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "cpu_threads_per_worker": self.cpu_threads,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
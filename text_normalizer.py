@@ -0,0 +1,159 @@
+"""
+Normalización de transcripciones con reglas compiladas una sola vez.
+
+- ``correct_common_errors``: todas las palabras numéricas en una alternancia
+  ``\\b(?:cero|uno|...)\\b`` con búsqueda en diccionario (una pasada en lugar
+  de un ``re.sub`` por palabra) y corrección de la primera palabra con tablas
+  a nivel de módulo.
+- ``filter_problematic_text``: elimina el eco del prompt en tres fases con la
+  misma semántica que la secuencia original de ~25 ``re.sub``:
+  1. frases "TU RESPUESTA CORTA EN ESPAÑOL" (solo si aparece "RESPUESTA");
+  2. cortes "frase del prompt hasta el final": cada patrón se busca solo en lo
+     que dejó el anterior (``endpos``), igual que aplicarlos en orden;
+  3. palabras sueltas del prompt en una sola alternancia.
+  Luego la puntuación se elimina con ``str.translate``.
+
+Los textos con saltos de línea usan la secuencia original (``.*`` no cruza
+líneas y los cortes dejarían de ser un simple prefijo).
+"""
+import re
+
+NUMBERS_TO_DIGITS = {
+    'cero': '0', 'zero': '0',
+    'uno': '1', 'una': '1',
+    'dos': '2', 'dose': '2',
+    'tres': '3', 'tree': '3',
+    'cuatro': '4', 'quatro': '4',
+    'cinco': '5', 'zinco': '5',
+    'seis': '6', 'ses': '6',
+    'siete': '7', 'siebe': '7',
+    'ocho': '8', 'hoco': '8',
+    'nueve': '9', 'nuebe': '9',
+    'diez': '10', 'dies': '10',
+    'once': '11', 'onze': '11',
+    'doce': '12', 'doze': '12',
+    'trece': '13', 'treze': '13',
+    'catorce': '14', 'quatorze': '14',
+    'quince': '15', 'quinze': '15',
+    'dieciséis': '16', 'dieciseis': '16',
+    'diecisiete': '17', 'diecisiebe': '17',
+    'dieciocho': '18', 'diecioco': '18',
+    'diecinueve': '19', 'diecinuebe': '19',
+    'veinte': '20', 'beinte': '20',
+}
+
+# Primera palabra mal reconocida -> e / s / t (se consultan en este orden)
+CORRECTIONS_E = {
+    'p': 'e', 'P': 'E',
+    'be': 'e', 'pe': 'e', 'se': 'e', 'te': 'e',
+    'esé': 'e', 'ese': 'e', 'ete': 'e', 'erre': 'e',
+    'he': 'e', 'ye': 'e', 'de': 'e', 'le': 'e',
+    'me': 'e', 'ne': 'e', 're': 'e', 've': 'e',
+    'ce': 'e', 'ge': 'e', 'je': 'e', 'ke': 'e',
+    'que': 'e', 'qe': 'e', 'eh': 'e', 'ay': 'e',
+    'ei': 'e', 'ie': 'e', 'ae': 'e', 'ea': 'e'
+}
+
+CORRECTIONS_S = {
+    'es': 's', 'se': 's', 'ze': 's', 'ce': 's',
+    'ps': 's', 'hs': 's', 'ss': 's', 'sz': 's',
+    'as': 's', 'is': 's', 'os': 's', 'us': 's',
+    'eso': 's', 'esa': 's', 'esi': 's', 'esu': 's',
+    'si': 's', 'sy': 's', 'ts': 's', 'xs': 's',
+    'cs': 's', 'ds': 's', 'fs': 's', 'gs': 's'
+}
+
+CORRECTIONS_T = {
+    'te': 't', 'et': 't', 'th': 't', 'ht': 't',
+    'pt': 't', 'tt': 't', 'dt': 't', 'ct': 't',
+    'at': 't', 'it': 't', 'ot': 't', 'ut': 't',
+    'to': 't', 'ta': 't', 'ti': 't', 'tu': 't',
+    'ty': 't', 'tr': 't', 'st': 't', 'xt': 't',
+    'ft': 't', 'gt': 't', 'kt': 't', 'lt': 't',
+    'mt': 't', 'nt': 't', 'rt': 't', 'wt': 't',
+}
+
+# Una sola tabla: CORRECTIONS_E tiene prioridad sobre S y S sobre T
+FIRST_WORD_CORRECTIONS = {**CORRECTIONS_T, **CORRECTIONS_S, **CORRECTIONS_E}
+
+RESPONSE_PATTERNS = [
+    r'TURESPUESTACORTAENESPAÑOL',
+    r'TU\s*RESPUESTA\s*CORTA\s*EN\s*ESPAÑOL',
+    r'RESPUESTA\s*CORTA\s*EN\s*ESPAÑOL',
+]
+
+# Frases del prompt inicial: se borra desde la frase hasta el final
+PROMPT_CUT_PATTERNS = [
+    r'usuario\s+dicta.*',
+    r'placa\s+vehicular.*',
+    r'transcribir\s+exactamente.*',
+    r'transcribir.*exactamente.*',
+    r'cada\s+carácter.*',
+    r'sin\s+interpretarlo.*',
+    r'como\s+palabras.*',
+    r'letras\s+y\s+números.*',
+]
+
+# Palabras sueltas del prompt si aparecen
+PROMPT_WORDS = [
+    'transcribir', 'exactamente', 'cada', 'carácter', 'dictado', 'interpretarlo',
+    'como', 'palabras', 'usuario', 'vehicular', 'peruana',
+]
+
+PUNCTUATION = '¡!¿?.,;:()"\'[]{}'
+
+_NUMBER_RE = re.compile(r'\b(?:' + '|'.join(map(re.escape, NUMBERS_TO_DIGITS)) + r')\b')
+_RESPONSE_RES = [re.compile(pattern, re.IGNORECASE) for pattern in RESPONSE_PATTERNS]
+_RESPONSE_GUARD_RE = re.compile(r'RESPUESTA', re.IGNORECASE)
+_PROMPT_CUT_RES = [re.compile(pattern, re.IGNORECASE) for pattern in PROMPT_CUT_PATTERNS]
+_PROMPT_WORD_RE = re.compile(r'\b(?:' + '|'.join(map(re.escape, PROMPT_WORDS)) + r')\b', re.IGNORECASE)
+_LEGACY_FILTER_RES = _RESPONSE_RES + _PROMPT_CUT_RES + [
+    re.compile(rf'\b{re.escape(word)}\b', re.IGNORECASE) for word in PROMPT_WORDS
+]
+_PUNCTUATION_TABLE = str.maketrans('', '', PUNCTUATION)
+_EDGE_RE = re.compile(r'^[-\s]+|[-\s]+$')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def _number_to_digit(match: re.Match) -> str:
+    return NUMBERS_TO_DIGITS[match.group()]
+
+
+def numbers_to_digits(text: str) -> str:
+    """Palabras numéricas completas -> dígitos, en una pasada"""
+    return _NUMBER_RE.sub(_number_to_digit, text)
+
+
+def correct_common_errors(text: str) -> str:
+    corrected = numbers_to_digits(text.lower().strip())
+    words = corrected.split()
+    if words:
+        words[0] = FIRST_WORD_CORRECTIONS.get(words[0], words[0])
+    return ' '.join(words) if words else corrected
+
+
+def _remove_prompt(text: str) -> str:
+    if '\n' in text:
+        for pattern in _LEGACY_FILTER_RES:
+            text = pattern.sub('', text)
+        return text
+
+    if _RESPONSE_GUARD_RE.search(text):
+        for pattern in _RESPONSE_RES:
+            text = pattern.sub('', text)
+
+    # Cada corte deja un prefijo: el siguiente patrón solo puede encajar dentro de él
+    cut = len(text)
+    for pattern in _PROMPT_CUT_RES:
+        match = pattern.search(text, 0, cut)
+        if match:
+            cut = match.start()
+
+    return _PROMPT_WORD_RE.sub('', text[:cut])
+
+
+def filter_problematic_text(text: str) -> str:
+    """Filtrar texto del modelo - elimina el eco del prompt y la puntuación"""
+    cleaned = _remove_prompt(text).translate(_PUNCTUATION_TABLE)
+    cleaned = _EDGE_RE.sub('', cleaned)
+    return _SPACES_RE.sub(' ', cleaned).strip()
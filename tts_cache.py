@@ -0,0 +1,200 @@
+"""
+Caché de síntesis TTS direccionada por contenido.
+
+La clave es un hash de (texto normalizado, voz, formato). Hay un nivel en
+memoria LRU acotado por entradas y bytes, y un nivel opcional en disco con TTL
+y tamaño máximo para sobrevivir reinicios del servicio.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza Unicode y espacios para que variantes triviales compartan entrada"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_key(text: str, voice: Optional[str], fmt: str) -> str:
+    raw = "\x1f".join([normalize_text(text), voice or "", fmt])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """LRU en memoria + nivel opcional en disco con TTL y límite de tamaño"""
+
+    def __init__(self, max_entries: int = 256, max_memory_bytes: int = 64 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, disk_ttl: float = 7 * 24 * 3600,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_ttl = disk_ttl
+        self.disk_max_bytes = disk_max_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # Un lock por clave en vuelo: peticiones simultáneas del mismo texto sintetizan una sola vez
+        self._inflight = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # --- nivel en memoria ---
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    def _memory_put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory and (len(self._memory) > self.max_entries
+                                    or self._memory_bytes > self.max_memory_bytes):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.evictions += 1
+
+    # --- nivel en disco ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.disk_ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"No se pudo leer la caché TTS en disco: {e}")
+            return None
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._disk_prune()
+        except OSError as e:
+            logger.warning(f"No se pudo escribir la caché TTS en disco: {e}")
+
+    def _disk_prune(self) -> None:
+        """Elimina entradas vencidas y, si se supera el límite, las más antiguas"""
+        now = time.time()
+        entries = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".bin"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.disk_ttl:
+                os.remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        while entries and total > self.disk_max_bytes:
+            _, size, path = entries.pop(0)
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+
+    # --- API pública ---
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._memory_get(key)
+        if data is not None:
+            self.memory_hits += 1
+            return data
+        data = self._disk_get(key)
+        if data is not None:
+            self.disk_hits += 1
+            self._memory_put(key, data)
+            return data
+        self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        self._memory_put(key, data)
+        self._disk_put(key, data)
+
+    def get_or_create(self, text: str, voice: Optional[str], fmt: str,
+                      factory: Callable[[str], bytes]) -> bytes:
+        """Devuelve el audio cacheado o lo genera con factory(texto_normalizado)"""
+        key = make_key(text, voice, fmt)
+        data = self.get(key)
+        if data is not None:
+            return data
+
+        with self._lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Otra petición pudo haberlo generado mientras esperábamos
+                data = self._memory_get(key)
+                if data is None:
+                    data = factory(normalize_text(text))
+                    self.put(key, data)
+        finally:
+            # También si factory falla: si no, el lock de la clave quedaría para siempre
+            with self._lock:
+                self._inflight.pop(key, None)
+        return data
+
+    def prewarm(self, texts: Iterable[str], voice: Optional[str], fmt: str,
+                factory: Callable[[str], bytes]) -> int:
+        """Genera por adelantado los textos fijos; devuelve cuántos quedaron en caché"""
+        warmed = 0
+        for text in texts:
+            try:
+                self.get_or_create(text, voice, fmt, factory)
+                warmed += 1
+            except Exception as e:
+                logger.warning(f"No se pudo precalentar '{text}': {e}")
+        return warmed
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_enabled": bool(self.disk_dir),
+        }
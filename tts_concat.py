@@ -0,0 +1,152 @@
+"""
+Síntesis por concatenación para confirmaciones de placa.
+
+Se pre-renderiza una sola vez la frase portadora ("¿Usted dijo") y cada letra
+A-Z y dígito 0-9 con la voz configurada. La respuesta se arma en NumPy uniendo
+esos clips PCM con fundidos cortos, sin inferencia del modelo por petición.
+"""
+import io
+import logging
+import threading
+import time
+import wave
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Nombre hablado de cada carácter (mismo vocabulario que reconoce stt_service)
+SPOKEN_CHARS = {
+    "A": "a", "B": "be", "C": "ce", "D": "de", "E": "e", "F": "efe",
+    "G": "ge", "H": "hache", "I": "i", "J": "jota", "K": "ka", "L": "ele",
+    "M": "eme", "N": "ene", "O": "o", "P": "pe", "Q": "cu", "R": "erre",
+    "S": "ese", "T": "te", "U": "u", "V": "ve", "W": "doble ve", "X": "equis",
+    "Y": "ye", "Z": "zeta",
+    "0": "cero", "1": "uno", "2": "dos", "3": "tres", "4": "cuatro",
+    "5": "cinco", "6": "seis", "7": "siete", "8": "ocho", "9": "nueve",
+}
+CARRIER_PHRASE = "¿Usted dijo"
+
+
+def wav_to_pcm(wav_bytes: bytes):
+    """WAV 16-bit mono → (int16 array, sample_rate)"""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+            raise ValueError("Se esperaba WAV PCM 16-bit mono")
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16), wf.getframerate()
+
+
+def pcm_to_wav(pcm: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def trim_silence(pcm: np.ndarray, sample_rate: int, threshold: int = 500, margin_ms: int = 10) -> np.ndarray:
+    """Recorta el silencio inicial y final que Piper deja en cada clip"""
+    voiced = np.flatnonzero(np.abs(pcm.astype(np.int32)) > threshold)
+    if voiced.size == 0:
+        return pcm
+    margin = int(sample_rate * margin_ms / 1000)
+    return pcm[max(0, voiced[0] - margin):voiced[-1] + margin + 1]
+
+
+class PhraseConcatenator:
+    """Arma "¿Usted dijo A B C 1 2 3?" a partir de clips pre-renderizados"""
+
+    def __init__(self, synthesize: Callable[[str], bytes], carrier: str = CARRIER_PHRASE,
+                 crossfade_ms: int = 10, char_gap_ms: int = 80, carrier_gap_ms: int = 120,
+                 retry_interval: float = 30.0):
+        self._synthesize = synthesize
+        self.carrier = carrier
+        self.crossfade_ms = crossfade_ms
+        self.char_gap_ms = char_gap_ms
+        self.carrier_gap_ms = carrier_gap_ms
+        self.sample_rate: Optional[int] = None
+        self.retry_interval = retry_interval
+        self._clips: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._last_attempt = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.sample_rate is not None
+
+    def prepare(self) -> None:
+        """Sintetiza la frase portadora y los 36 caracteres (una sola vez)"""
+        with self._lock:
+            if self.ready:
+                return
+            self._last_attempt = time.monotonic()
+            texts = {"carrier": self.carrier, **SPOKEN_CHARS}
+            clips = {}
+            sample_rate = None
+            for name, text in texts.items():
+                pcm, rate = wav_to_pcm(self._synthesize(text))
+                if sample_rate is not None and rate != sample_rate:
+                    raise ValueError("Los clips tienen frecuencias de muestreo distintas")
+                sample_rate = rate
+                clips[name] = trim_silence(pcm, rate).astype(np.float32)
+
+            self._clips = clips
+            self._fade = int(sample_rate * self.crossfade_ms / 1000)
+            self._char_gap = np.zeros(int(sample_rate * self.char_gap_ms / 1000), dtype=np.float32)
+            self._carrier_gap = np.zeros(int(sample_rate * self.carrier_gap_ms / 1000), dtype=np.float32)
+            self.sample_rate = sample_rate
+            logger.info(f"Clips de concatenación listos ({len(clips)} clips, {sample_rate} Hz)")
+
+    def prepare_in_background(self) -> None:
+        """Reintenta prepare() en un hilo, como mucho una vez cada retry_interval"""
+        if self.ready or self._lock.locked():
+            return
+        if time.monotonic() - self._last_attempt < self.retry_interval:
+            return
+        self._last_attempt = time.monotonic()
+
+        def run():
+            try:
+                self.prepare()
+            except Exception as e:
+                logger.error(f"No se pudieron preparar los clips de placa: {e}")
+
+        threading.Thread(target=run, name="plate-clips", daemon=True).start()
+
+    def _join(self, parts: List[np.ndarray]) -> np.ndarray:
+        """Superpone cada par de clips consecutivos con un fundido lineal"""
+        fade = self._fade
+        total = sum(len(p) for p in parts) - fade * (len(parts) - 1)
+        out = np.zeros(max(total, 0), dtype=np.float32)
+        ramp_in = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+        ramp_out = ramp_in[::-1]
+
+        position = 0
+        for index, part in enumerate(parts):
+            part = part.copy()
+            if fade and len(part) >= 2 * fade:
+                if index > 0:
+                    part[:fade] *= ramp_in
+                if index < len(parts) - 1:
+                    part[-fade:] *= ramp_out
+            out[position:position + len(part)] += part[:len(out) - position]
+            position += len(part) - fade
+        return out
+
+    def render(self, plate: str) -> bytes:
+        """WAV de la confirmación de la placa, sin pasar por Piper.
+        Sin clips listos falla de inmediato (el llamador usa Piper) y los prepara en segundo plano."""
+        if not self.ready:
+            self.prepare_in_background()
+            raise RuntimeError("Clips de concatenación aún no preparados")
+        parts = [self._clips["carrier"], self._carrier_gap]
+        for char in plate.upper():
+            clip = self._clips.get(char)
+            if clip is None:
+                continue
+            parts.extend([clip, self._char_gap])
+        pcm = np.clip(self._join(parts[:-1]), -32768, 32767).astype(np.int16)
+        return pcm_to_wav(pcm, self.sample_rate)
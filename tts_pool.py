@@ -0,0 +1,383 @@
+"""
+Pool de procesos Piper persistentes.
+
+Cada worker arranca Piper una sola vez en modo ``--json-input`` (la voz ONNX se
+carga al inicio) y recibe una línea JSON por petición en stdin:
+``{"text": ..., "output_file": ...}``. Piper escribe el WAV e imprime su ruta;
+la línea con esa ruta, venga por stdout o por stderr, marca el fin de síntesis.
+
+``--json-input`` y ``--espeak_data`` solo existen en el binario C++. El CLI del
+paquete Python piper-tts (p. ej. ``venv_310/bin/piper``) los rechaza, así que
+``create_piper_backend`` detecta cuál está instalado: con piper-tts la voz se
+carga en este proceso (``PiperVoiceRunner``) o, si el paquete no se puede
+importar desde este intérprete, se lanza un proceso por petición
+(``PiperSubprocessRunner``). Los tres exponen synthesize/health_check/stats/close.
+
+El WAV se lee y se borra en la misma petición; el directorio de trabajo va en
+tmpfs (``/dev/shm``) cuando existe, así ese archivo nunca llega al disco.
+"""
+import collections
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directorio en memoria preferido para los WAV de trabajo de Piper
+SHM_DIR = "/dev/shm"
+
+
+def scratch_dir(preferred: Optional[str] = None) -> Optional[str]:
+    """preferred, o /dev/shm si es escribible; None = directorio temporal del sistema"""
+    for candidate in (preferred, SHM_DIR):
+        if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return candidate
+    return None
+
+
+class PiperWorker:
+    """Proceso Piper de larga vida que sintetiza una petición a la vez"""
+
+    def __init__(self, piper_exec: str, voice_path: str, output_dir: str,
+                 espeak_data: Optional[str] = None, worker_id: int = 0):
+        self.piper_exec = piper_exec
+        self.voice_path = voice_path
+        self.output_dir = output_dir
+        self.espeak_data = espeak_data
+        self.worker_id = worker_id
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.requests_served = 0
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._stderr_tail = collections.deque(maxlen=20)
+        # Tomado mientras atiende una petición; el chequeo de salud solo toca workers libres
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self) -> None:
+        command = [
+            self.piper_exec,
+            "--model", self.voice_path,
+            "--json-input",
+            "--output_dir", self.output_dir,
+        ]
+        if self.espeak_data:
+            command += ["--espeak_data", self.espeak_data]
+
+        self._lines = queue.Queue()
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            cwd=os.getcwd()
+        )
+        # Lectores dedicados: ambas salidas se buscan para la ruta generada, stderr se guarda para diagnóstico
+        threading.Thread(target=self._read_stdout, args=(self.process, self._lines), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process, self._lines), daemon=True).start()
+        logger.info(f"Worker Piper {self.worker_id} iniciado (pid {self.process.pid})")
+
+    def _read_stdout(self, process: subprocess.Popen, lines: queue.Queue) -> None:
+        for line in process.stdout:
+            lines.put(line.strip())
+        lines.put(None)  # EOF: el proceso terminó
+
+    def _read_stderr(self, process: subprocess.Popen, lines: queue.Queue) -> None:
+        for line in process.stderr:
+            self._stderr_tail.append(line.rstrip())
+            lines.put(line.strip())
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self) -> None:
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def synthesize(self, text: str, timeout: float) -> bytes:
+        """Envía el texto por stdin y devuelve el WAV generado como bytes"""
+        if not self.is_alive():
+            raise RuntimeError(f"Worker Piper {self.worker_id} no está activo")
+
+        output_file = os.path.join(self.output_dir, f"{uuid.uuid4()}.wav")
+        request = json.dumps({"text": text, "output_file": output_file}, ensure_ascii=False)
+        try:
+            self.process.stdin.write(request + "\n")
+            self.process.stdin.flush()
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise TimeoutError(f"Piper timeout después de {timeout} segundos")
+                if line is None:
+                    stderr = " | ".join(self._stderr_tail)
+                    raise RuntimeError(f"Piper terminó inesperadamente (código {self.process.poll()}): {stderr}")
+                if output_file in line:
+                    break
+
+            with open(output_file, "rb") as f:
+                audio = f.read()
+            self.requests_served += 1
+            return audio
+        finally:
+            if os.path.exists(output_file):
+                try:
+                    os.remove(output_file)
+                except Exception:
+                    pass
+
+
+class PiperPool:
+    """Pool de workers Piper con timeout por petición, chequeo de salud y reinicio tras caídas"""
+
+    def __init__(self, piper_exec: str, voice_path: str, size: int = 2,
+                 espeak_data: Optional[str] = None, request_timeout: float = 30.0,
+                 acquire_timeout: float = 30.0, health_interval: float = 10.0,
+                 work_dir: Optional[str] = None):
+        self.size = size
+        self.request_timeout = request_timeout
+        self.acquire_timeout = acquire_timeout
+        self.output_dir = tempfile.mkdtemp(prefix="piper_pool_", dir=scratch_dir(work_dir))
+        self._idle: "queue.Queue[PiperWorker]" = queue.Queue()
+        self._workers: List[PiperWorker] = []
+        self._closed = threading.Event()
+
+        for worker_id in range(size):
+            worker = PiperWorker(piper_exec, voice_path, self.output_dir, espeak_data, worker_id)
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+        if health_interval > 0:
+            threading.Thread(target=self._monitor, args=(health_interval,), daemon=True).start()
+
+    def synthesize(self, text: str, timeout: Optional[float] = None) -> bytes:
+        if self._closed.is_set():
+            raise RuntimeError("Pool de Piper cerrado")
+        try:
+            worker = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise RuntimeError("No hay workers Piper disponibles")
+
+        try:
+            with worker.lock:
+                if not worker.is_alive():
+                    logger.warning(f"Worker Piper {worker.worker_id} caído, reiniciando")
+                    worker.restart()
+                try:
+                    return worker.synthesize(text, timeout or self.request_timeout)
+                except Exception:
+                    # Tras un timeout o una caída el estado de stdin/stdout es incierto: proceso nuevo
+                    worker.restart()
+                    raise
+        finally:
+            self._idle.put(worker)
+
+    def health_check(self) -> dict:
+        """Reinicia los workers caídos y devuelve el estado del pool"""
+        for worker in self._workers:
+            if self._closed.is_set() or not worker.lock.acquire(blocking=False):
+                continue
+            try:
+                if not worker.is_alive():
+                    logger.warning(f"Worker Piper {worker.worker_id} caído (chequeo de salud), reiniciando")
+                    worker.restart()
+            finally:
+                worker.lock.release()
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "json-input",
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "alive": sum(1 for w in self._workers if w.is_alive()),
+            "restarts": sum(w.restarts for w in self._workers),
+            "requests_served": sum(w.requests_served for w in self._workers),
+        }
+
+    def _monitor(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            try:
+                self.health_check()
+            except Exception as e:
+                logger.error(f"Error en chequeo de salud de Piper: {e}")
+
+    def close(self) -> None:
+        self._closed.set()
+        for worker in self._workers:
+            worker.stop()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+
+class PiperVoiceRunner:
+    """Voz de piper-tts cargada una vez en este proceso.
+
+    espeak-ng (fonemización) guarda estado global en el proceso y no es reentrante,
+    así que las síntesis se serializan; ONNX Runtime ya reparte cada una entre núcleos.
+    """
+
+    def __init__(self, voice_path: str, acquire_timeout: float = 30.0):
+        from piper import PiperVoice  # ImportError si piper-tts está en otro entorno
+        self.voice = PiperVoice.load(voice_path)
+        self.acquire_timeout = acquire_timeout
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        # piper-tts >= 1.3: synthesize_wav(text, wav_file); 1.2: synthesize(text, wav_file)
+        self._write_wav = getattr(self.voice, "synthesize_wav", None) or self.voice.synthesize
+
+    def synthesize(self, text: str, timeout: Optional[float] = None) -> bytes:
+        # En proceso no hay timeout por petición: solo se limita la espera por la voz
+        if not self._lock.acquire(timeout=self.acquire_timeout):
+            raise RuntimeError("Voz Piper ocupada")
+        try:
+            buffer = io.BytesIO()
+            with wave.open(buffer, "wb") as wav_file:
+                self._write_wav(text, wav_file)
+            self.requests_served += 1
+            return buffer.getvalue()
+        finally:
+            self._lock.release()
+
+    def health_check(self) -> dict:
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "piper-tts",
+            "size": 1,
+            "idle": 0 if self._lock.locked() else 1,
+            "alive": 1,
+            "restarts": 0,
+            "requests_served": self.requests_served,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class PiperSubprocessRunner:
+    """Un proceso Piper por petición (``--output_file``), para el CLI de piper-tts sin el paquete importable"""
+
+    def __init__(self, piper_exec: str, voice_path: str, size: int = 2,
+                 request_timeout: float = 30.0, acquire_timeout: float = 30.0,
+                 work_dir: Optional[str] = None):
+        self.piper_exec = piper_exec
+        self.voice_path = voice_path
+        self.size = size
+        self.request_timeout = request_timeout
+        self.acquire_timeout = acquire_timeout
+        self.output_dir = tempfile.mkdtemp(prefix="piper_pool_", dir=scratch_dir(work_dir))
+        self.requests_served = 0
+        self._slots = threading.BoundedSemaphore(size)
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def synthesize(self, text: str, timeout: Optional[float] = None) -> bytes:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise RuntimeError("No hay workers Piper disponibles")
+        with self._lock:
+            self._active += 1
+        output_file = os.path.join(self.output_dir, f"{uuid.uuid4()}.wav")
+        try:
+            # El WAV está completo cuando el proceso termina: no depende de lo que imprima
+            result = subprocess.run(
+                [self.piper_exec, "--model", self.voice_path, "--output_file", output_file],
+                input=text,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                timeout=timeout or self.request_timeout,
+                cwd=os.getcwd()
+            )
+            if result.returncode != 0 or not os.path.exists(output_file):
+                stderr = " | ".join(result.stderr.strip().splitlines()[-20:])
+                raise RuntimeError(f"Piper falló (código {result.returncode}): {stderr}")
+            with open(output_file, "rb") as f:
+                audio = f.read()
+            with self._lock:
+                self.requests_served += 1
+            return audio
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"Piper timeout después de {timeout or self.request_timeout} segundos")
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+            if os.path.exists(output_file):
+                try:
+                    os.remove(output_file)
+                except Exception:
+                    pass
+
+    def health_check(self) -> dict:
+        return self.stats()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "subprocess",
+                "size": self.size,
+                "idle": self.size - self._active,
+                "alive": self.size,
+                "restarts": 0,
+                "requests_served": self.requests_served,
+            }
+
+    def close(self) -> None:
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+
+def piper_cli_kind(piper_exec: str) -> str:
+    """"python" si el ejecutable es el script de consola de piper-tts, "cpp" si es el binario"""
+    try:
+        with open(piper_exec, "rb") as f:
+            first_line = f.readline(256)
+    except OSError:
+        return "cpp"
+    return "python" if first_line.startswith(b"#!") and b"python" in first_line else "cpp"
+
+
+def create_piper_backend(piper_exec: str, voice_path: str, size: int = 2,
+                         espeak_data: Optional[str] = None, request_timeout: float = 30.0,
+                         work_dir: Optional[str] = None):
+    """PiperPool con el binario C++; con piper-tts, la voz en proceso o un proceso por petición"""
+    if piper_cli_kind(piper_exec) == "cpp":
+        return PiperPool(piper_exec, voice_path, size=size, espeak_data=espeak_data,
+                         request_timeout=request_timeout, work_dir=work_dir)
+    try:
+        runner = PiperVoiceRunner(voice_path)
+        logger.info("piper-tts detectado: voz cargada en este proceso")
+        return runner
+    except ImportError:
+        logger.warning(f"piper-tts detectado en {piper_exec} pero no importable desde este intérprete: "
+                       f"un proceso Piper por petición")
+        return PiperSubprocessRunner(piper_exec, voice_path, size=size,
+                                     request_timeout=request_timeout, work_dir=work_dir)
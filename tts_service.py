@@ -2,8 +2,44 @@ import subprocess
 import uuid
 import os
 import platform
+import atexit
+import threading
 from pathlib import Path
 import time
+import logging
+from tts_pool import create_piper_backend
+from tts_cache import TTSCache
+from tts_concat import PhraseConcatenator, CARRIER_PHRASE
+from tts_streaming import split_sentences, stream_wav
+from audio_formats import OutputFormat, WAV, OPUS_PRESETS, encode
+from model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Backend de Piper (tts_pool.create_piper_backend): pool persistente con el binario C++ o, con el
+# paquete piper-tts, voz en proceso; la voz se carga una sola vez en ambos casos
+PIPER_POOL_SIZE = int(os.getenv("PIPER_POOL_SIZE", "2"))
+PIPER_TIMEOUT = float(os.getenv("PIPER_TIMEOUT", "30"))
+# Directorio de los WAV de trabajo del pool (por defecto /dev/shm si existe)
+PIPER_WORK_DIR = os.getenv("PIPER_WORK_DIR")
+# "0": Piper no se precarga ni cuenta para /health/ready (despliegues solo STT)
+PIPER_PRELOAD = os.getenv("PIPER_PRELOAD", "1") == "1"
+
+# Caché de síntesis: LRU en memoria y, si TTS_CACHE_DIR está definido, nivel en disco
+TTS_CACHE_ENTRIES = int(os.getenv("TTS_CACHE_ENTRIES", "256"))
+TTS_CACHE_MEMORY_MB = int(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")
+TTS_CACHE_TTL = float(os.getenv("TTS_CACHE_TTL", str(7 * 24 * 3600)))
+TTS_CACHE_DISK_MB = int(os.getenv("TTS_CACHE_DISK_MB", "512"))
+
+# "concat": confirmaciones de placa armadas con clips pre-renderizados; "full": Piper completo
+PLATE_TTS_MODE = os.getenv("PLATE_TTS_MODE", "concat")
+
+# Preset Opus para las respuestas comprimidas (ver audio_formats.OPUS_PRESETS)
+TTS_OPUS_PRESET = os.getenv("TTS_OPUS_PRESET", "mobile")
+if TTS_OPUS_PRESET not in OPUS_PRESETS:
+    logger.warning(f"TTS_OPUS_PRESET desconocido '{TTS_OPUS_PRESET}', usando 'mobile'")
+    TTS_OPUS_PRESET = "mobile"
 
 
 def get_piper_config():
@@ -107,33 +143,31 @@ def get_piper_config():
         }
 
 
-# Obtener configuración
-try:
-    config = get_piper_config()
-    PIPER_EXEC = config["PIPER_EXEC"]
-    VOICE_PATH = config["VOICE_PATH"]
-    ESPEAK_DATA = config["ESPEAK_DATA"]
+_piper_config = None
+_piper_config_lock = threading.Lock()
 
-    # Mostrar configuración detectada
-    voice_name = Path(VOICE_PATH).stem
-    piper_source = "Python venv" if "venv_310" in PIPER_EXEC else "Sistema"
-    print(f"Piper configurado para {platform.system()} ({piper_source})")
-    print(f"Ejecutable: {PIPER_EXEC}")
-    print(f"Voz: {voice_name}")
-    if ESPEAK_DATA:
-        print(f"Espeak data: {ESPEAK_DATA}")
 
-except Exception as e:
-    print(f"Error configurando Piper: {e}")
-    PIPER_EXEC = None
-    VOICE_PATH = None
-    ESPEAK_DATA = None
+def piper_config() -> dict:
+    """Configuración de Piper detectada la primera vez que se necesita (no al importar)"""
+    global _piper_config
+    with _piper_config_lock:
+        if _piper_config is None:
+            try:
+                _piper_config = get_piper_config()
+                piper_source = "Python venv" if "venv_310" in _piper_config["PIPER_EXEC"] else "Sistema"
+                logger.info(f"Piper configurado para {platform.system()} ({piper_source}): "
+                            f"{_piper_config['PIPER_EXEC']}, voz {Path(_piper_config['VOICE_PATH']).stem}, "
+                            f"espeak data {_piper_config['ESPEAK_DATA']}")
+            except Exception as e:
+                logger.error(f"Error configurando Piper: {e}")
+                _piper_config = {"PIPER_EXEC": None, "VOICE_PATH": None, "ESPEAK_DATA": None}
+        return _piper_config
 
 
 def synthesize_to_wav(text: str) -> str:
     """Síntesis de voz con Piper - multiplataforma"""
-
-    if not PIPER_EXEC or not VOICE_PATH:
+    config = piper_config()
+    if not config["PIPER_EXEC"] or not config["VOICE_PATH"]:
         raise RuntimeError("Piper no está configurado correctamente")
 
     # Crear directorio de salida (DESCOMENTAR PARA USAR EN Windows)
@@ -146,9 +180,9 @@ def synthesize_to_wav(text: str) -> str:
     try:
         # Comando básico
         command = [
-            PIPER_EXEC,
+            config["PIPER_EXEC"],
             "--model",
-            VOICE_PATH,
+            config["VOICE_PATH"],
             "--output-file",
             str(output_wav.absolute())
         ]
@@ -200,18 +234,127 @@ def synthesize(text: str) -> str:
     return synthesize_to_wav(text)
 
 
+_pool = None
+
+
+def _load_piper_pool():
+    global _pool
+    config = piper_config()
+    if not config["PIPER_EXEC"] or not config["VOICE_PATH"]:
+        raise RuntimeError("Piper no está configurado correctamente")
+    _pool = create_piper_backend(
+        config["PIPER_EXEC"],
+        config["VOICE_PATH"],
+        size=PIPER_POOL_SIZE,
+        espeak_data=config["ESPEAK_DATA"],
+        request_timeout=PIPER_TIMEOUT,
+        work_dir=PIPER_WORK_DIR
+    )
+    atexit.register(_pool.close)
+    return _pool
+
+
+def _warm_piper_pool(pool) -> None:
+    # Primera inferencia de la voz fuera de la caché (no deja nada guardado)
+    pool.synthesize("Listo.", timeout=PIPER_TIMEOUT)
+
+
+registry.register("piper", _load_piper_pool, _warm_piper_pool, preload=PIPER_PRELOAD)
+
+
+def get_pool():
+    """Pool de Piper (cargado por model_registry la primera vez que se necesita)"""
+    return registry.get("piper")
+
+
+def _synthesize_with_pool(text: str) -> bytes:
+    return get_pool().synthesize(text, timeout=PIPER_TIMEOUT)
+
+
+cache = TTSCache(
+    max_entries=TTS_CACHE_ENTRIES,
+    max_memory_bytes=TTS_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=TTS_CACHE_DIR,
+    disk_ttl=TTS_CACHE_TTL,
+    disk_max_bytes=TTS_CACHE_DISK_MB * 1024 * 1024
+)
+
+
+def voice_name() -> str:
+    voice_path = piper_config()["VOICE_PATH"]
+    return Path(voice_path).stem if voice_path else ""
+
+
+def format_key(fmt: OutputFormat) -> str:
+    """Formato de la clave de caché: los codificados incluyen el preset"""
+    return fmt.name if fmt is WAV else f"{fmt.name}:{TTS_OPUS_PRESET}"
+
+
+def encode_audio(wav_bytes: bytes, fmt: OutputFormat) -> bytes:
+    return encode(wav_bytes, fmt, TTS_OPUS_PRESET)
+
+
+def synthesize_bytes(text: str, fmt: OutputFormat = WAV) -> bytes:
+    """Síntesis con caché y pool de Piper: devuelve el audio en memoria sin lanzar procesos nuevos.
+    Otros formatos se codifican una sola vez a partir del WAV (también cacheado)."""
+    if fmt is WAV:
+        return cache.get_or_create(text, voice_name(), "wav", _synthesize_with_pool)
+    return cache.get_or_create(text, voice_name(), format_key(fmt),
+                               lambda normalized: encode_audio(synthesize_bytes(normalized), fmt))
+
+
+def synthesize_stream(text: str):
+    """Iterador de bloques WAV (cabecera de streaming + PCM) oración por oración, con caché por oración"""
+    return stream_wav(split_sentences(text), synthesize_bytes)
+
+
+def prewarm(texts: list, formats: tuple = (WAV,)) -> int:
+    """Sintetiza (y codifica) por adelantado los mensajes fijos para que lleguen servidos desde caché"""
+    warmed = cache.prewarm(texts, voice_name(), "wav", _synthesize_with_pool)
+    for fmt in formats:
+        if fmt is not WAV:
+            warmed += cache.prewarm(texts, voice_name(), format_key(fmt),
+                                    lambda normalized: encode_audio(synthesize_bytes(normalized), fmt))
+    return warmed
+
+
+# Los clips pasan por synthesize_bytes, así también quedan en la caché TTS
+plate_concatenator = PhraseConcatenator(synthesize_bytes)
+
+
+def prepare_plate_concatenation() -> None:
+    if PLATE_TTS_MODE == "concat":
+        plate_concatenator.prepare()
+
+
+def synthesize_plate_confirmation(plate: str, fmt: OutputFormat = WAV) -> bytes:
+    """Audio de "¿Usted dijo {plate}?"; por concatenación si está habilitada"""
+    if PLATE_TTS_MODE == "concat":
+        try:
+            # Cada placa es casi única: se codifica al vuelo, sin ocupar la caché
+            return encode_audio(plate_concatenator.render(plate), fmt)
+        except Exception as e:
+            logger.warning(f"Concatenación no disponible, usando Piper: {e}")
+    return synthesize_bytes(f"{CARRIER_PHRASE} {plate}?", fmt)
+
+
 def get_system_info() -> dict:
     """Información del sistema para debugging"""
+    config = piper_config()
+    piper_exec, voice_path, espeak_data = config["PIPER_EXEC"], config["VOICE_PATH"], config["ESPEAK_DATA"]
     return {
         "platform": platform.system(),
-        "piper_exec": PIPER_EXEC,
-        "voice_path": VOICE_PATH,
-        "voice_name": Path(VOICE_PATH).stem if VOICE_PATH else None,
-        "espeak_data": ESPEAK_DATA,
-        "piper_exists": PIPER_EXEC and os.path.exists(PIPER_EXEC) if PIPER_EXEC else False,
-        "voice_exists": VOICE_PATH and os.path.exists(VOICE_PATH) if VOICE_PATH else False,
-        "espeak_exists": ESPEAK_DATA and os.path.exists(ESPEAK_DATA) if ESPEAK_DATA else False,
-        "is_venv": "venv_310" in (PIPER_EXEC or "")
+        "piper_exec": piper_exec,
+        "voice_path": voice_path,
+        "voice_name": Path(voice_path).stem if voice_path else None,
+        "espeak_data": espeak_data,
+        "piper_exists": piper_exec and os.path.exists(piper_exec) if piper_exec else False,
+        "voice_exists": voice_path and os.path.exists(voice_path) if voice_path else False,
+        "espeak_exists": espeak_data and os.path.exists(espeak_data) if espeak_data else False,
+        "is_venv": "venv_310" in (piper_exec or ""),
+        "pool": _pool.stats() if _pool else None,
+        "opus_preset": TTS_OPUS_PRESET,
+        "cache": cache.stats()
     }
 
 
@@ -1,14 +1,21 @@
 import os
 import uuid
 from pathlib import Path
-from TTS.api import TTS
 from num2words import num2words
 import re
+from model_registry import registry
 
 # Configuración del modelo
 MODEL_NAME = "tts_models/es/css10/vits"
 
-tts = TTS(model_name=MODEL_NAME, progress_bar=False, gpu=False)
+
+def _load_tts():
+    from TTS.api import TTS
+    return TTS(model_name=MODEL_NAME, progress_bar=False, gpu=False)
+
+
+# Voz alternativa: solo se carga si se usa (no cuenta para readiness)
+registry.register("coqui_vits", _load_tts, preload=False)
 
 def convertir_numeros_a_texto(texto: str) -> str:
     """Convierte todos los números en el texto a su forma escrita en español."""
@@ -33,6 +40,6 @@ def synthesize_alternative(text: str) -> str:
     output_wav = f"audio_out/{uuid.uuid4()}.wav"
     
     # Ejecuta TTS con el texto convertido
-    tts.tts_to_file(text=texto_convertido, file_path=output_wav)
+    registry.get("coqui_vits").tts_to_file(text=texto_convertido, file_path=output_wav)
     
     return output_wav
@@ -0,0 +1,81 @@
+"""
+Síntesis TTS en streaming, oración por oración.
+
+El texto se divide en oraciones y cada una se sintetiza por separado con la
+función de síntesis del servicio (pool de Piper + caché). El primer bloque
+lleva una cabecera WAV con tamaño "desconocido" (0xFFFFFFFF, como hacen los
+servidores de audio en vivo) seguida del PCM de la primera oración; el resto se
+envía a medida que cada oración termina. La reproducción empieza tras la
+primera oración.
+
+La granularidad es la oración y no el bloque de audio: Piper con
+``--output-raw`` en un proceso persistente escribe el PCM de todas las
+peticiones seguido en stdout, sin marca de fin de enunciado, así que el pool usa
+``--output_file`` (la ruta impresa en stdout marca el fin) con un WAV temporal
+por oración en tmpfs (ver tts_pool).
+
+Si una oración posterior a la primera falla, ya se enviaron la cabecera y el
+status 200: el error se registra y el stream termina limpio con lo sintetizado.
+"""
+import logging
+import re
+import struct
+from typing import Callable, Iterable, Iterator, List
+
+from tts_concat import wav_to_pcm
+
+logger = logging.getLogger(__name__)
+
+# Fin de oración: puntuación final seguida de espacio (los "¿¡" de apertura quedan con su oración)
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?;:…])\s+')
+# Tamaño desconocido en las cabeceras RIFF/data
+STREAMING_SIZE = 0xFFFFFFFF
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    """Oraciones del texto; las muy cortas se unen a la siguiente para no cortar la prosodia"""
+    sentences = []
+    pending = ""
+    for part in _SENTENCE_END_RE.split(text.strip()):
+        if not part:
+            continue
+        pending = f"{pending} {part}" if pending else part
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        sentences.append(pending)
+    return sentences
+
+
+def streaming_wav_header(sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """Cabecera WAV PCM con tamaños 0xFFFFFFFF (longitud total desconocida)"""
+    block_align = channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", STREAMING_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                sample_rate * block_align, block_align, sample_width * 8)
+        + b"data" + struct.pack("<I", STREAMING_SIZE)
+    )
+
+
+def stream_wav(sentences: Iterable[str], synthesize: Callable[[str], bytes]) -> Iterator[bytes]:
+    """Cabecera + PCM de cada oración, sintetizada justo antes de entregarla"""
+    sample_rate = None
+    sent = 0
+    for sentence in sentences:
+        try:
+            pcm, rate = wav_to_pcm(synthesize(sentence))
+            if sample_rate is not None and rate != sample_rate:
+                raise ValueError(f"Frecuencia de muestreo inconsistente: {rate} != {sample_rate}")
+        except Exception as e:
+            if sample_rate is None:
+                raise  # antes de responder: el endpoint aún puede devolver 500
+            logger.error(f"Síntesis en streaming interrumpida tras {sent} oraciones: {e}")
+            return
+        if sample_rate is None:
+            sample_rate = rate
+            yield streaming_wav_header(rate) + pcm.tobytes()
+        else:
+            yield pcm.tobytes()
+        sent += 1
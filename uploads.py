@@ -0,0 +1,138 @@
+"""
+Lectura de archivos subidos directamente a memoria.
+
+Con ``UploadFile = File(...)`` Starlette recibe el cuerpo completo antes de
+llamar al endpoint y guarda en disco todo archivo de más de 1 MB
+(``SpooledTemporaryFile``). ``read_upload`` lee en cambio ``request.stream()``
+y pasa cada bloque al parser incremental de python-multipart (el mismo que usa
+Starlette): solo se conservan en memoria los bytes del campo de archivo pedido,
+y la lectura se corta en cuanto superan el límite (o antes de empezar si
+Content-Length ya lo excede). También acepta el audio como cuerpo crudo
+(``audio/wav``, ``application/octet-stream``, ...).
+
+El resultado es un único ``bytes`` (``b"".join`` de los bloques);
+``io.BytesIO`` comparte ese buffer sin copiarlo al decodificar.
+"""
+from typing import List
+
+from fastapi import Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Margen para cabeceras multipart y campos de texto al comparar Content-Length con el límite
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """El archivo supera el tamaño máximo permitido"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Archivo mayor a {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UploadFormatError(ValueError):
+    """El cuerpo no es multipart válido o no trae el campo de archivo"""
+
+
+class _FieldCollector:
+    """Callbacks de MultipartParser que guardan solo los datos del campo pedido"""
+
+    def __init__(self, field: str, max_bytes: int):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.found = False
+        self._header_field = b""
+        self._header_value = b""
+        self._in_field = False
+
+    def on_part_begin(self) -> None:
+        self._in_field = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            _, params = parse_options_header(self._header_value)
+            if params.get(b"name", b"").decode("latin-1") == self.field:
+                self._in_field = True
+                self.found = True
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._in_field:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        self.chunks.append(data[start:end])
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_part_data": self.on_part_data,
+        }
+
+
+async def read_upload(request: Request, field: str, max_bytes: int) -> bytes:
+    """Contenido del archivo `field` en memoria; UploadTooLargeError apenas se pasa de max_bytes"""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLargeError(max_bytes)
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data":
+        chunks, size = [], 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    if b"boundary" not in params:
+        raise UploadFormatError("Falta el boundary multipart")
+    collector = _FieldCollector(field, max_bytes)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            # Los demás campos no se guardan, pero el cuerpo entero también tiene tope
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD:
+                raise UploadTooLargeError(max_bytes)
+            parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError as e:
+        raise UploadFormatError(f"Cuerpo multipart inválido: {e}")
+    if not collector.found:
+        raise UploadFormatError(f"Falta el campo de archivo '{field}'")
+    return b"".join(collector.chunks)
+
+
+def upload_openapi(field: str) -> dict:
+    """requestBody para la documentación OpenAPI (el cuerpo ya no lo declara File(...))"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {field: {"type": "string", "format": "binary"}},
+                        "required": [field],
+                    }
+                }
+            },
+        }
+    }
@@ -2,10 +2,83 @@ import webrtcvad
 import collections
 import numpy as np
 import wave
+import io
+import logging
+import subprocess
+import threading
+from contextlib import contextmanager
+import soundfile as sf
 
-# Aggressivity Level
+logger = logging.getLogger(__name__)
+
+# Aggressivity Level (instancia compartida heredada; el código nuevo usa vad_pool)
 vad = webrtcvad.Vad(2);
 
+class VadPool:
+	"""
+	Reparte instancias webrtcvad.Vad: cada stream o hilo usa la suya (con su propia
+	agresividad y estado interno) y al terminar la devuelve reiniciada para reutilizarla.
+	"""
+
+	def __init__(self, max_idle_per_level=16):
+		self.max_idle_per_level = max_idle_per_level
+		self._idle = {level: [] for level in range(4)}
+		self._lock = threading.Lock()
+		self.created = 0
+		self.reused = 0
+		self.in_use = 0
+
+	def acquire(self, aggressiveness=2):
+		if aggressiveness not in self._idle:
+			raise ValueError("La agresividad del VAD debe estar entre 0 y 3")
+		with self._lock:
+			self.in_use += 1
+			if self._idle[aggressiveness]:
+				self.reused += 1
+				return self._idle[aggressiveness].pop()
+			self.created += 1
+		return webrtcvad.Vad(aggressiveness)
+
+	def release(self, detector, aggressiveness=2):
+		detector = _reset_vad(detector, aggressiveness)
+		with self._lock:
+			self.in_use -= 1
+			if len(self._idle[aggressiveness]) < self.max_idle_per_level:
+				self._idle[aggressiveness].append(detector)
+
+	@contextmanager
+	def vad(self, aggressiveness=2):
+		"""Instancia exclusiva durante el bloque 'with'"""
+		detector = self.acquire(aggressiveness)
+		try:
+			yield detector
+		finally:
+			self.release(detector, aggressiveness)
+
+	def session(self, aggressiveness=2, sample_rate=16000, frame_duration_ms=30, padding_duration_ms=300):
+		"""Segmentador en streaming con su propio Vad; cerrar con close() o usar 'with'"""
+		return VadSession(self, aggressiveness, sample_rate, frame_duration_ms, padding_duration_ms)
+
+	def stats(self):
+		with self._lock:
+			return {
+				"created": self.created,
+				"reused": self.reused,
+				"in_use": self.in_use,
+				"idle": {level: len(items) for level, items in self._idle.items()},
+			}
+
+def _reset_vad(detector, aggressiveness):
+	"""Borra el estado adaptativo del Vad para que el siguiente stream empiece limpio"""
+	try:
+		webrtcvad._webrtcvad.init(detector._vad)
+	except AttributeError:
+		return webrtcvad.Vad(aggressiveness)
+	detector.set_mode(aggressiveness)
+	return detector
+
+vad_pool = VadPool()
+
 def frame_generator(frame_duration_ms, audio, sample_rate):
 	bytes_for_frame = int(sample_rate * frame_duration_ms / 1000) * 2
 	offset = 0
@@ -13,40 +86,229 @@ def frame_generator(frame_duration_ms, audio, sample_rate):
 		yield audio[offset:offset + bytes_for_frame]
 		offset += bytes_for_frame
 
+def speech_flags(audio, sample_rate, frame_duration_ms, vad_instance=None):
+	"""Marca de voz por trama; las tramas son vistas NumPy sobre el buffer, sin copias"""
+	samples_per_frame = int(sample_rate * frame_duration_ms / 1000)
+	bytes_per_frame = samples_per_frame * 2
+	# Misma cantidad de tramas que frame_generator (la última trama exacta no se emite)
+	num_frames = max(0, (len(audio) - 1) // bytes_per_frame)
+	if num_frames == 0:
+		return np.zeros(0, dtype=bool)
+	frames = np.frombuffer(audio, dtype=np.int16, count=num_frames * samples_per_frame)
+	frames = frames.reshape(num_frames, samples_per_frame)
+	if vad_instance is None:
+		with vad_pool.vad() as detector:
+			return _frame_flags(frames, sample_rate, detector)
+	return _frame_flags(frames, sample_rate, vad_instance)
+
+def _frame_flags(frames, sample_rate, detector):
+	return np.fromiter(
+		(detector.is_speech(frame.data.cast('B'), sample_rate) for frame in frames),
+		dtype=bool, count=len(frames)
+	)
+
+def _first_crossing(cumsum, start, window, threshold, full_window_hits, count_voiced):
+	"""Primera trama >= start donde la ventana (vaciada en start) supera el umbral"""
+	num_frames = len(cumsum) - 1
+	# Ventanas incompletas: el ring buffer se vació en start y aún no tiene `window` tramas
+	partial_end = min(start + window - 1, num_frames)
+	if partial_end > start:
+		ends = np.arange(start, partial_end)
+		voiced = cumsum[ends + 1] - cumsum[start]
+		counts = voiced if count_voiced else (ends + 1 - start) - voiced
+		hits = np.flatnonzero(counts > threshold)
+		if hits.size:
+			return int(ends[hits[0]])
+	# Ventanas completas: precalculadas con la suma móvil
+	position = np.searchsorted(full_window_hits, start + window - 1)
+	if position < len(full_window_hits):
+		return int(full_window_hits[position])
+	return None
+
+def vad_segments(sample_rate, frame_duration_ms, padding_duration_ms, audio, vad_instance=None):
+	"""
+	Segmentación equivalente a vad_collector, vectorizada: marcas de voz en una pasada,
+	disparo/liberación con suma móvil sobre el ring buffer. Devuelve (inicio, fin) en bytes.
+	"""
+	window = int(padding_duration_ms / frame_duration_ms)
+	flags = speech_flags(audio, sample_rate, frame_duration_ms, vad_instance)
+	num_frames = len(flags)
+	if window == 0 or num_frames == 0:
+		return []
+
+	threshold = 0.9 * window
+	bytes_per_frame = int(sample_rate * frame_duration_ms / 1000) * 2
+	cumsum = np.concatenate(([0], np.cumsum(flags, dtype=np.int64)))
+	voiced_full = cumsum[window:] - cumsum[:-window]  # ventana que termina en k + window - 1
+	trigger_hits = np.flatnonzero(voiced_full > threshold) + window - 1
+	release_hits = np.flatnonzero((window - voiced_full) > threshold) + window - 1
+
+	segments = []
+	start = 0
+	while start < num_frames:
+		trigger = _first_crossing(cumsum, start, window, threshold, trigger_hits, True)
+		if trigger is None:
+			break
+		segment_start = max(start, trigger - window + 1)
+		release = _first_crossing(cumsum, trigger + 1, window, threshold, release_hits, False)
+		if release is None:
+			segments.append((segment_start * bytes_per_frame, num_frames * bytes_per_frame))
+			break
+		segments.append((segment_start * bytes_per_frame, (release + 1) * bytes_per_frame))
+		start = release + 1
+	return segments
+
 def vad_collector(sample_rate, frame_duration_ms, padding_duration_ms, audio):
-	frames = frame_generator(frame_duration_ms, audio, sample_rate)
-	num_padding_frames = int(padding_duration_ms / frame_duration_ms)
+	"""Compatibilidad: mismos segmentos que antes, como bytes, a partir de vad_segments"""
+	for start, end in vad_segments(sample_rate, frame_duration_ms, padding_duration_ms, audio):
+		yield bytes(audio[start:end])
+
+class VadSegmenter:
+	"""Versión incremental de vad_collector: recibe PCM 16-bit por trozos y entrega cada enunciado al cerrarse"""
 
-	ring_buffer = collections.deque(maxlen=num_padding_frames)
-	triggered = False
+	def __init__(self, sample_rate=16000, frame_duration_ms=30, padding_duration_ms=300, vad_instance=None):
+		self.sample_rate = sample_rate
+		self.bytes_per_frame = int(sample_rate * frame_duration_ms / 1000) * 2
+		self.vad = vad_instance or webrtcvad.Vad(2)
+		self.ring_buffer = collections.deque(maxlen=int(padding_duration_ms / frame_duration_ms))
+		self.triggered = False
+		self.voiced_frames = []
+		self._pending = bytearray()
 
-	voiced_frames = []
+	def push(self, chunk):
+		"""Agrega audio y devuelve la lista de segmentos de voz que se cerraron"""
+		self._pending.extend(chunk)
+		segments = []
+		bpf = self.bytes_per_frame
+		offset = 0
+		while offset + bpf <= len(self._pending):
+			segment = self._process_frame(bytes(self._pending[offset:offset + bpf]))
+			if segment:
+				segments.append(segment)
+			offset += bpf
+		del self._pending[:offset]
+		return segments
 
-	for frame in frames:
-		is_speech = vad.is_speech(frame, sample_rate)
-		if not triggered:
+	def _process_frame(self, frame):
+		is_speech = self.vad.is_speech(frame, self.sample_rate)
+		ring_buffer = self.ring_buffer
+		if not self.triggered:
 			ring_buffer.append((frame, is_speech))
-			num_voiced = len ([f for f, speech in ring_buffer if speech])
+			num_voiced = len([f for f, speech in ring_buffer if speech])
 			if num_voiced > 0.9 * ring_buffer.maxlen:
-				triggered = True
-				for f, s in ring_buffer:
-					voiced_frames.append(f)
+				self.triggered = True
+				self.voiced_frames.extend(f for f, s in ring_buffer)
 				ring_buffer.clear()
 		else:
-			voiced_frames.append(frame)
+			self.voiced_frames.append(frame)
 			ring_buffer.append((frame, is_speech))
 			num_unvoiced = len([f for f, speech in ring_buffer if not speech])
 			if num_unvoiced > 0.9 * ring_buffer.maxlen:
-				triggered = False
-				yield b''.join(voiced_frames)
-				ring_buffer.clear()
-				voiced_frames = []
-	if(voiced_frames):
-		yield b''.join(voiced_frames)
-			
+				segment = b''.join(self.voiced_frames)
+				self.reset()
+				return segment
+		return None
+
+	@property
+	def in_speech(self):
+		return self.triggered
+
+	@property
+	def voiced_audio(self):
+		"""Audio acumulado del enunciado en curso (para hipótesis intermedias)"""
+		return b''.join(self.voiced_frames)
+
+	def flush(self):
+		"""Cierra el enunciado en curso (fin de stream); None si no había voz"""
+		segment = b''.join(self.voiced_frames) if self.voiced_frames else None
+		self.reset()
+		self._pending.clear()
+		return segment
+
+	def reset(self):
+		self.triggered = False
+		self.voiced_frames = []
+		self.ring_buffer.clear()
+
+class VadSession(VadSegmenter):
+	"""VadSegmenter con un Vad propio tomado de un VadPool (sin estado compartido entre streams)"""
+
+	def __init__(self, pool, aggressiveness=2, sample_rate=16000, frame_duration_ms=30, padding_duration_ms=300):
+		self._pool = pool
+		self.aggressiveness = aggressiveness
+		super().__init__(sample_rate, frame_duration_ms, padding_duration_ms,
+						 vad_instance=pool.acquire(aggressiveness))
+
+	def close(self):
+		if self.vad is not None:
+			self._pool.release(self.vad, self.aggressiveness)
+			self.vad = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+def trim_to_voiced(audio, sample_rate=16000, aggressiveness=2, padding_ms=200, frame_duration_ms=30):
+	"""Recorta el silencio inicial y final con webrtcvad: tramo con voz más un margen (float32)"""
+	pcm16 = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+	with vad_pool.vad(aggressiveness) as detector:
+		voiced = np.flatnonzero(speech_flags(pcm16, sample_rate, frame_duration_ms, detector))
+	if voiced.size == 0:
+		# Sin voz detectada: mejor no recortar y dejar que Whisper decida
+		return audio
+	frame_samples = int(sample_rate * frame_duration_ms / 1000)
+	padding = int(sample_rate * padding_ms / 1000)
+	start = max(0, voiced[0] * frame_samples - padding)
+	end = min(len(audio), (voiced[-1] + 1) * frame_samples + padding)
+	return audio[start:end]
+
+def pcm16_to_float32(audio):
+	"""PCM 16-bit little-endian → float32 en [-1, 1] para Whisper"""
+	return np.frombuffer(audio, dtype=np.int16).astype(np.float32) / 32768.0
+
 def write_wave(path, audio, sample_rate):
 	with wave.open(path, 'wb') as wf:
 		wf.setnchannels(1)
 		wf.setsampwidth(2)
 		wf.setframerate(sample_rate)
 		wf.writeframes(audio)			
+
+def decode_audio(source, sample_rate=16000):
+	"""Decodifica audio (ruta o bytes) a PCM float32 mono en memoria, sin pasar por disco"""
+	try:
+		if isinstance(source, (bytes, bytearray, memoryview)):
+			data, source_rate = sf.read(io.BytesIO(source), dtype='float32', always_2d=True)
+		else:
+			data, source_rate = sf.read(source, dtype='float32', always_2d=True)
+	except (RuntimeError, TypeError, ValueError) as e:
+		# Contenedores que libsndfile no soporta (mp4, webm, ...): respaldo con ffmpeg
+		logger.info(f"Decodificación en memoria no soportada ({e}), usando ffmpeg")
+		return decode_audio_ffmpeg(source, sample_rate)
+
+	audio = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+	if source_rate != sample_rate:
+		import librosa
+		audio = librosa.resample(audio, orig_sr=source_rate, target_sr=sample_rate)
+	return np.ascontiguousarray(audio, dtype=np.float32)
+
+def decode_audio_ffmpeg(source, sample_rate=16000):
+	"""Respaldo: ffmpeg decodifica a float32 por stdout (la entrada en bytes va por stdin)"""
+	in_memory = isinstance(source, (bytes, bytearray, memoryview))
+	command = [
+		"ffmpeg", "-loglevel", "error",
+		"-i", "pipe:0" if in_memory else str(source),
+		"-f", "f32le", "-ac", "1", "-ar", str(sample_rate),
+		"pipe:1"
+	]
+	try:
+		result = subprocess.run(
+			command,
+			input=bytes(source) if in_memory else None,
+			capture_output=True, check=True, timeout=10
+		)
+	except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+		logger.error(f"ffmpeg no pudo decodificar el audio: {e}")
+		return None
+	return np.frombuffer(result.stdout, dtype=np.float32)